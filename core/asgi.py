@@ -11,23 +11,21 @@ import os
 
 from django.core.asgi import get_asgi_application
 from channels.routing import ProtocolTypeRouter, URLRouter
-from channels.auth import AuthMiddlewareStack
 # from channels.security.websocket import AllowedHostsOriginValidator
-from channels.sessions import SessionMiddlewareStack
-from core import routing
 import django
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 
 django.setup()
 
+from core import routing
+from core.middleware import JWTAuthMiddlewareStack
+
 application = ProtocolTypeRouter({
     "http": get_asgi_application(),
-    "websocket": SessionMiddlewareStack(  # Wrap with SessionMiddleware first
-        AuthMiddlewareStack(  # Then add AuthMiddleware
-            URLRouter(
-                routing.websocket_urlpatterns
-            )
+    "websocket": JWTAuthMiddlewareStack(  # SimpleJWT access token from ?token= or subprotocol
+        URLRouter(
+            routing.websocket_urlpatterns
         )
     ),
 })
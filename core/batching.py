@@ -0,0 +1,99 @@
+import atexit
+import logging
+import threading
+
+from django.db import InterfaceError, OperationalError, close_old_connections, transaction
+
+logger = logging.getLogger(__name__)
+
+# Errors that say nothing about the rows themselves; the batch is retried whole
+TRANSIENT_ERRORS = (OperationalError, InterfaceError)
+
+
+class BatchWriter:
+    """
+    Buffers unsaved model instances and writes them with bulk_create from a
+    background thread, every `batch_size` rows or `flush_interval` seconds.
+    Whatever is still buffered gets flushed at interpreter exit.
+
+    `on_flush`, if given, is called with each written batch in the same
+    transaction as the insert (e.g. to maintain rollups).
+
+    A batch that fails on a transient database error is put back and retried
+    on the next flush, keeping at most `max_pending` rows. Any other error is
+    narrowed down by splitting the batch, so only the offending rows are
+    dropped.
+    """
+
+    def __init__(self, model, batch_size=100, flush_interval=2.0, on_flush=None, max_pending=10000):
+        self.model = model
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.on_flush = on_flush
+        self.max_pending = max_pending
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        atexit.register(self.flush)
+
+    def add(self, obj):
+        with self._lock:
+            self._buffer.append(obj)
+            full = len(self._buffer) >= self.batch_size
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run,
+                    name=f'{self.model.__name__}BatchWriter',
+                    daemon=True
+                )
+                self._thread.start()
+        if full:
+            self._wakeup.set()
+
+    def pending(self):
+        with self._lock:
+            return len(self._buffer)
+
+    def flush(self):
+        """Write everything buffered so far; returns the number of rows written"""
+        with self._lock:
+            batch, self._buffer = self._buffer, []
+        if not batch:
+            return 0
+        try:
+            failed = self._write(batch)
+        except TRANSIENT_ERRORS:
+            logger.exception("Failed to write %d %s rows, will retry", len(batch), self.model.__name__)
+            with self._lock:
+                self._buffer[:0] = batch
+                overflow = len(self._buffer) - self.max_pending
+                if overflow > 0:
+                    del self._buffer[:overflow]
+                    logger.warning("Dropped %d buffered %s rows", overflow, self.model.__name__)
+            return 0
+        return len(batch) - len(failed)
+
+    def _write(self, batch):
+        """Write `batch`, splitting it to isolate bad rows; returns the rows dropped"""
+        try:
+            with transaction.atomic():
+                self.model.objects.bulk_create(batch, batch_size=self.batch_size)
+                if self.on_flush:
+                    self.on_flush(batch)
+            return []
+        except TRANSIENT_ERRORS:
+            raise
+        except Exception:
+            if len(batch) == 1:
+                logger.exception("Dropping %s row that cannot be written", self.model.__name__)
+                return batch
+        middle = len(batch) // 2
+        return self._write(batch[:middle]) + self._write(batch[middle:])
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+            close_old_connections()
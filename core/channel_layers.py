@@ -0,0 +1,382 @@
+"""
+Channel layer for running several ASGI workers on one host without Redis.
+
+Every worker process connects to a small hub (``manage.py run_channel_hub``)
+over a Unix socket. The hub only keeps group membership: a group_send is
+one frame to the hub, which forwards the already-encoded message once per
+worker that has members in the group, and the worker hands it to each of
+its local channels. Channel names embed the id of the connection that
+created them, so the hub always knows where to route. If the hub restarts,
+workers reconnect under the same id and re-register their groups.
+
+Loops that receive (the server's) get a hub connection each. Sends from
+short-lived loops, e.g. async_to_sync in a view, are handed to one
+long-lived connection on a background thread instead of connecting anew
+every time.
+
+Frames are a 4-byte big-endian length followed by a msgpack list.
+"""
+import asyncio
+import logging
+import os
+import socket
+import struct
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+import msgpack
+from channels.exceptions import ChannelFull
+from channels.layers import BaseChannelLayer
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SOCKET_PATH = '/tmp/couplequest-channels.sock'
+
+_HEADER = struct.Struct('>I')
+
+
+async def read_frame(reader):
+    header = await reader.readexactly(_HEADER.size)
+    return msgpack.unpackb(await reader.readexactly(_HEADER.unpack(header)[0]))
+
+
+def encode_frame(*parts):
+    body = msgpack.packb(list(parts))
+    return _HEADER.pack(len(body)) + body
+
+
+def channel_owner(channel):
+    """Connection id embedded in a channel name made by new_channel"""
+    return channel.split('!', 1)[0].rsplit('.', 1)[-1]
+
+
+class ChannelHub:
+    """
+    Routing process behind UnixSocketChannelLayer. Holds group membership
+    and the connection of every worker; message bodies pass through as
+    opaque bytes.
+    """
+
+    def __init__(self, path=DEFAULT_SOCKET_PATH, group_expiry=86400):
+        self.path = path
+        self.group_expiry = group_expiry
+        self.groups = defaultdict(dict)  # group -> {channel: expires_at}
+        self.workers = {}  # connection id -> StreamWriter
+
+    async def serve(self):
+        if os.path.exists(self.path):
+            try:
+                _, writer = await asyncio.open_unix_connection(self.path)
+            except ConnectionError:
+                # Left behind by a hub that didn't shut down cleanly
+                os.unlink(self.path)
+            else:
+                writer.close()
+                raise RuntimeError(f"A channel hub is already listening on {self.path}")
+        server = await asyncio.start_unix_server(self._handle, path=self.path)
+        logger.info("Channel hub listening on %s", self.path)
+        async with server:
+            await server.serve_forever()
+
+    async def _handle(self, reader, writer):
+        conn_id = None
+        try:
+            op, conn_id = await read_frame(reader)
+            if op != 'hello':
+                return
+            # A reconnecting worker may arrive before its old connection is noticed as dead
+            self.workers[conn_id] = writer
+            while True:
+                frame = await read_frame(reader)
+                self._dispatch(frame)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            if conn_id is not None:
+                self._forget(conn_id, writer)
+            writer.close()
+
+    def _dispatch(self, frame):
+        op = frame[0]
+        if op == 'group_add':
+            _, group, channel = frame
+            self.groups[group][channel] = time.monotonic() + self.group_expiry
+        elif op == 'group_discard':
+            _, group, channel = frame
+            members = self.groups.get(group)
+            if members is not None:
+                members.pop(channel, None)
+                if not members:
+                    del self.groups[group]
+        elif op == 'send':
+            _, channel, body = frame
+            self._deliver(channel_owner(channel), [channel], body)
+        elif op == 'group_send':
+            _, group, body = frame
+            by_owner = defaultdict(list)
+            now = time.monotonic()
+            members = self.groups.get(group, {})
+            for channel, expires_at in list(members.items()):
+                if expires_at < now:
+                    del members[channel]
+                    continue
+                by_owner[channel_owner(channel)].append(channel)
+            for owner, channels in by_owner.items():
+                self._deliver(owner, channels, body)
+        elif op == 'flush':
+            self.groups.clear()
+
+    def _deliver(self, owner, channels, body):
+        writer = self.workers.get(owner)
+        if writer is not None and not writer.is_closing():
+            writer.write(encode_frame('deliver', channels, body))
+
+    def _forget(self, conn_id, writer):
+        if self.workers.get(conn_id) is not writer:
+            # Superseded by a reconnect, which re-registered the groups
+            return
+        self.workers.pop(conn_id, None)
+        for group in list(self.groups):
+            members = self.groups[group]
+            for channel in [c for c in members if channel_owner(c) == conn_id]:
+                del members[channel]
+            if not members:
+                del self.groups[group]
+
+
+class _Connection:
+    """
+    One worker's link to the hub, bound to the event loop that opened it.
+    When the link drops it keeps reconnecting under the same id and replays
+    its group memberships, so channels named after it keep receiving.
+    """
+    MAX_RETRY_DELAY = 5
+
+    def __init__(self, layer):
+        self.layer = layer
+        self.loop = asyncio.get_running_loop()
+        self.id = uuid.uuid4().hex[:12]
+        # (group, channel) pairs added through this connection
+        self.memberships = set()
+        self.writer = None
+        self.sock = None
+        self.reader_task = None
+        self._connected = asyncio.Event()
+
+    async def open(self):
+        """Connect, introduce ourselves and re-register our groups; returns the reader"""
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.setblocking(False)
+        try:
+            await self.loop.sock_connect(sock, self.layer.path)
+            reader, writer = await asyncio.open_unix_connection(sock=sock)
+        except BaseException:
+            sock.close()
+            raise
+        self.sock = sock
+        writer.write(encode_frame('hello', self.id))
+        for group, channel in list(self.memberships):
+            writer.write(encode_frame('group_add', group, channel))
+        await writer.drain()
+        self.writer = writer
+        self._connected.set()
+        return reader
+
+    def start(self, reader):
+        self.reader_task = asyncio.get_running_loop().create_task(self._run(reader))
+
+    async def _run(self, reader):
+        while True:
+            try:
+                while True:
+                    op, channels, body = await read_frame(reader)
+                    if op == 'deliver':
+                        self.layer._deliver_local(channels, body)
+            except (asyncio.IncompleteReadError, ConnectionError):
+                logger.warning("Lost connection to channel hub at %s, reconnecting", self.layer.path)
+            self._connected.clear()
+            self.writer.close()
+            reader = await self._reconnect()
+
+    async def _reconnect(self):
+        delay = 0.1
+        while True:
+            await asyncio.sleep(delay)
+            try:
+                reader = await self.open()
+            except OSError:
+                delay = min(delay * 2, self.MAX_RETRY_DELAY)
+                continue
+            logger.info("Reconnected to channel hub at %s", self.layer.path)
+            return reader
+
+    async def send(self, *parts):
+        if not self._connected.is_set():
+            try:
+                await asyncio.wait_for(self._connected.wait(), self.layer.connect_timeout)
+            except asyncio.TimeoutError:
+                raise ConnectionError(f"Channel hub at {self.layer.path} is unreachable")
+        self.writer.write(encode_frame(*parts))
+        await self.writer.drain()
+
+    def close(self):
+        if self.loop.is_closed():
+            # Nothing can be scheduled on the loop any more; close the socket itself
+            if self.sock is not None:
+                self.sock.close()
+            return
+        if self.reader_task is not None:
+            self.reader_task.cancel()
+        if self.writer is not None:
+            self.writer.close()
+
+
+class UnixSocketChannelLayer(BaseChannelLayer):
+    """
+    Channel layer shared by the worker processes on one host through a
+    ChannelHub. Messages for this process's channels are queued locally,
+    as in InMemoryChannelLayer.
+    """
+
+    extensions = ['groups', 'flush']
+
+    def __init__(self, path=DEFAULT_SOCKET_PATH, expiry=60, group_expiry=86400,
+                 capacity=100, channel_capacity=None, connect_timeout=5, **kwargs):
+        super().__init__(expiry=expiry, capacity=capacity, channel_capacity=channel_capacity, **kwargs)
+        self.path = path
+        self.group_expiry = group_expiry
+        # How long sends wait for a lost hub connection to come back
+        self.connect_timeout = connect_timeout
+        self.channels = {}
+        # One hub connection per event loop that receives, plus the relay's
+        self._connections = {}
+        self._receiving_loops = set()
+        self._relay = None
+        self._relay_lock = threading.Lock()
+
+    def _relay_loop(self):
+        """Event loop of the daemon thread that holds the connection for short-lived loops"""
+        with self._relay_lock:
+            if self._relay is None:
+                self._relay = asyncio.new_event_loop()
+                threading.Thread(
+                    target=self._relay.run_forever, name='ChannelHubRelay', daemon=True
+                ).start()
+            return self._relay
+
+    async def _on_hub(self, operation, *args):
+        """
+        Run `operation(connection, *args)` on this loop's hub connection if
+        the loop receives, otherwise on the relay's.
+        """
+        loop = asyncio.get_running_loop()
+        if loop in self._receiving_loops or loop is self._relay:
+            return await operation(await self._connection(), *args)
+        future = asyncio.run_coroutine_threadsafe(self._on_hub(operation, *args), self._relay_loop())
+        return await asyncio.wrap_future(future)
+
+    async def _connection(self):
+        loop = asyncio.get_running_loop()
+        connection = self._connections.get(loop)
+        if connection is not None:
+            return connection
+        for stale in [other for other in self._connections if other.is_closed()]:
+            self._connections.pop(stale).close()
+            self._receiving_loops.discard(stale)
+
+        connection = _Connection(self)
+        reader = await connection.open()
+        if loop in self._connections:
+            connection.close()
+            return self._connections[loop]
+        self._connections[loop] = connection
+        connection.start(reader)
+        return connection
+
+    def _deliver_local(self, channels, body):
+        message = msgpack.unpackb(body)
+        expires_at = time.time() + self.expiry
+        for channel in channels:
+            queue = self.channels.get(channel)
+            if queue is None:
+                # Nobody has received on it yet; queue it like InMemoryChannelLayer would
+                queue = self.channels[channel] = asyncio.Queue(maxsize=self.get_capacity(channel))
+            if queue.full():
+                continue
+            queue.put_nowait((expires_at, message))
+
+    # Channel layer API
+
+    async def send(self, channel, message):
+        assert isinstance(message, dict), "message is not a dict"
+        self.require_valid_channel_name(channel)
+        assert "__asgi_channel__" not in message
+
+        queue = self.channels.get(channel)
+        if queue is not None and queue.full():
+            raise ChannelFull(channel)
+        await self._on_hub(_Connection.send, 'send', channel, msgpack.packb(message))
+
+    async def receive(self, channel):
+        self.require_valid_channel_name(channel)
+        queue = self.channels.get(channel)
+        if queue is None:
+            queue = self.channels[channel] = asyncio.Queue(maxsize=self.get_capacity(channel))
+        self._receiving_loops.add(asyncio.get_running_loop())
+        await self._connection()
+
+        try:
+            while True:
+                expires_at, message = await queue.get()
+                if expires_at >= time.time():
+                    return message
+        finally:
+            if queue.empty():
+                self.channels.pop(channel, None)
+
+    async def new_channel(self, prefix='specific'):
+        # Whoever makes a channel receives on it, on this loop
+        self._receiving_loops.add(asyncio.get_running_loop())
+        connection = await self._connection()
+        return f'{prefix}.{connection.id}!{uuid.uuid4().hex}'
+
+    async def group_add(self, group, channel):
+        self.require_valid_group_name(group)
+        self.require_valid_channel_name(channel)
+        await self._on_hub(self._group_add, group, channel)
+
+    async def _group_add(self, connection, group, channel):
+        connection.memberships.add((group, channel))
+        await connection.send('group_add', group, channel)
+
+    async def group_discard(self, group, channel):
+        self.require_valid_group_name(group)
+        self.require_valid_channel_name(channel)
+        await self._on_hub(self._group_discard, group, channel)
+
+    async def _group_discard(self, connection, group, channel):
+        # The membership may have been added through another connection
+        for other in list(self._connections.values()):
+            other.memberships.discard((group, channel))
+        await connection.send('group_discard', group, channel)
+
+    async def group_send(self, group, message):
+        assert isinstance(message, dict), "message is not a dict"
+        self.require_valid_group_name(group)
+        await self._on_hub(_Connection.send, 'group_send', group, msgpack.packb(message))
+
+    async def flush(self):
+        self.channels = {}
+        for connection in list(self._connections.values()):
+            connection.memberships.clear()
+        await self._on_hub(_Connection.send, 'flush')
+
+    async def close(self):
+        for connection in list(self._connections.values()):
+            if connection.loop is self._relay:
+                self._relay.call_soon_threadsafe(connection.close)
+            else:
+                connection.close()
+        self._connections.clear()
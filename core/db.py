@@ -0,0 +1,20 @@
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+
+def increment_or_create(model, lookup, increments):
+    """
+    Add `increments` ({field: amount}) to the row matching `lookup` with a
+    single UPDATE ... SET field = field + amount, creating the row if it
+    doesn't exist yet. `lookup` must match a unique constraint.
+    """
+    rows = model.objects.filter(**lookup)
+    expressions = {field: F(field) + amount for field, amount in increments.items()}
+    if rows.update(**expressions):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**lookup, **increments)
+    except IntegrityError:
+        # Someone else created the row in the meantime
+        rows.update(**expressions)
@@ -0,0 +1,89 @@
+import threading
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, description=''):
+        self.name = name
+        self.description = description
+        self._values = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(labels):
+        return tuple(sorted(labels.items()))
+
+    def remove(self, **labels):
+        with self._lock:
+            self._values.pop(self._key(labels), None)
+
+    def values(self):
+        with self._lock:
+            return [(dict(key), value) for key, value in self._values.items()]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class MetricsRegistry:
+    """
+    Process-local counters and gauges, optionally labelled. Cheap enough to
+    update on hot paths; read with snapshot() or the /api/metrics/ view.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, description):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, description)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} is already registered as a {metric.kind}")
+            return metric
+
+    def counter(self, name, description=''):
+        return self._get(Counter, name, description)
+
+    def gauge(self, name, description=''):
+        return self._get(Gauge, name, description)
+
+    def snapshot(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {
+            metric.name: {
+                'type': metric.kind,
+                'description': metric.description,
+                'values': [{'labels': labels, 'value': value} for labels, value in metric.values()],
+            }
+            for metric in metrics
+        }
+
+
+registry = MetricsRegistry()
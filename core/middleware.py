@@ -1,38 +1,101 @@
 # middleware.py
-from channels.auth import AuthMiddlewareStack
+from urllib.parse import parse_qs
+
 from channels.db import database_sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
 from django.contrib.auth.models import AnonymousUser
-from rest_framework.authtoken.models import Token
+from django.dispatch import receiver
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from couple.couple import get_user_couple_id, user_couple_changed
+
+from .ttl import TTLCache
+
+# Browsers can't set headers on a WebSocket; they offer the subprotocols
+# ["jwt", "<token>"] instead and the server selects "jwt", never the token.
+# `jwt.<token>` in a single entry is also read, for non-browser clients.
+JWT_SUBPROTOCOL = 'jwt'
+JWT_SUBPROTOCOL_PREFIX = 'jwt.'
+
+# user id -> (user, couple id) for recently connected users
+ws_identity_cache = TTLCache(
+    ttl=getattr(settings, 'WS_AUTH_CACHE_TIMEOUT', 30),
+    maxsize=getattr(settings, 'WS_AUTH_CACHE_SIZE', 10000)
+)
+
+
+def forget_ws_identity(*user_ids):
+    """Drop cached WebSocket identities, e.g. after a couple change"""
+    for user_id in user_ids:
+        if user_id:
+            ws_identity_cache.pop(user_id)
+
+
+@receiver(user_couple_changed)
+def forget_changed_identities(sender, user_ids, **kwargs):
+    forget_ws_identity(*user_ids)
+
+
+def get_raw_token(scope):
+    query = parse_qs(scope.get('query_string', b'').decode())
+    if query.get('token'):
+        return query['token'][0]
+    subprotocols = list(scope.get('subprotocols', ()))
+    if JWT_SUBPROTOCOL in subprotocols:
+        position = subprotocols.index(JWT_SUBPROTOCOL) + 1
+        if position < len(subprotocols):
+            return subprotocols[position]
+    for subprotocol in subprotocols:
+        if subprotocol.startswith(JWT_SUBPROTOCOL_PREFIX):
+            return subprotocol[len(JWT_SUBPROTOCOL_PREFIX):]
+    return None
+
+
+@database_sync_to_async
+def _load_identity(user_id):
+    user = get_user_model().objects.filter(**{api_settings.USER_ID_FIELD: user_id}, is_active=True).first()
+    if user is None:
+        return None
+    return user, get_user_couple_id(user)
+
+
+class JWTAuthMiddleware:
+    """
+    Authenticates WebSocket connections with a SimpleJWT access token from
+    `?token=` or the subprotocol list (see JWT_SUBPROTOCOL). The token is verified locally
+    (signature and expiry), and the user and their couple id come from a
+    short-lived in-process cache, so a reconnect storm doesn't turn into a
+    storm of queries. Sets scope['user'] and scope['couple_id'].
+    """
 
-class TokenAuthMiddleware:
     def __init__(self, inner):
         self.inner = inner
 
     async def __call__(self, scope, receive, send):
-        query_string = scope.get('query_string', b'').decode()
-        token_param = None
-        
-        # Parse query string for token
-        for param in query_string.split('&'):
-            if param.startswith('token='):
-                token_param = param.split('=')[1]
-                break
-
-        if token_param:
-            user = await self.get_user(token_param)
-            scope['user'] = user if user else AnonymousUser()
-        else:
-            scope['user'] = AnonymousUser()
-
+        scope = dict(scope, user=AnonymousUser(), couple_id=None)
+        identity = await self.resolve(get_raw_token(scope))
+        if identity is not None:
+            scope['user'], scope['couple_id'] = identity
         return await self.inner(scope, receive, send)
 
-    @database_sync_to_async
-    def get_user(self, token_key):
+    async def resolve(self, raw_token):
+        if not raw_token:
+            return None
         try:
-            token = Token.objects.get(key=token_key)
-            return token.user
-        except Token.DoesNotExist:
+            user_id = AccessToken(raw_token)[api_settings.USER_ID_CLAIM]
+        except (TokenError, KeyError):
             return None
 
-def TokenAuthMiddlewareStack(inner):
-    return TokenAuthMiddleware(AuthMiddlewareStack(inner))
\ No newline at end of file
+        identity = ws_identity_cache.get(user_id)
+        if identity is None:
+            identity = await _load_identity(user_id)
+            if identity is not None:
+                ws_identity_cache.set(user_id, identity)
+        return identity
+
+
+def JWTAuthMiddlewareStack(inner):
+    return JWTAuthMiddleware(inner)
@@ -0,0 +1,64 @@
+import time
+
+from django.core.cache import caches
+
+
+class SlidingWindowLimiter:
+    """
+    Sliding window counter kept in the Django cache.
+
+    Each key keeps a counter for the current and previous fixed window; the
+    previous one is weighted by how much of it still overlaps the sliding
+    window. Checks and hits are O(1) cache operations, no DB involved.
+    """
+
+    def __init__(self, scope, limit, window, cache_alias='default'):
+        self.scope = scope
+        self.limit = limit
+        self.window = window
+        self.cache_alias = cache_alias
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    def _key(self, ident, bucket):
+        return f'ratelimit:{self.scope}:{ident}:{bucket}'
+
+    def count(self, *idents, now=None):
+        """Estimated number of hits in the last `window` seconds, per ident"""
+        now = time.time() if now is None else now
+        bucket, elapsed = divmod(now, self.window)
+        bucket = int(bucket)
+        weight = 1 - elapsed / self.window
+
+        keys = {}
+        for ident in idents:
+            keys[ident] = (self._key(ident, bucket), self._key(ident, bucket - 1))
+        values = self.cache.get_many([key for pair in keys.values() for key in pair])
+
+        return {
+            ident: values.get(current, 0) + values.get(previous, 0) * weight
+            for ident, (current, previous) in keys.items()
+        }
+
+    def is_limited(self, *idents, now=None):
+        return any(count >= self.limit for count in self.count(*idents, now=now).values())
+
+    def hit(self, *idents, now=None):
+        now = time.time() if now is None else now
+        bucket = int(now // self.window)
+        for ident in idents:
+            key = self._key(ident, bucket)
+            # Keep the bucket around while it is still the "previous" window
+            self.cache.add(key, 0, timeout=self.window * 2)
+            try:
+                self.cache.incr(key)
+            except ValueError:
+                self.cache.set(key, 1, timeout=self.window * 2)
+
+    def reset(self, *idents):
+        bucket = int(time.time() // self.window)
+        self.cache.delete_many([
+            self._key(ident, b) for ident in idents for b in (bucket, bucket - 1)
+        ])
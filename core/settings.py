@@ -10,7 +10,9 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 import os
+import warnings
 import environ
+from django.core.exceptions import ImproperlyConfigured
 from decouple import config
 import dj_database_url
 
@@ -96,11 +98,142 @@ ASGI_APPLICATION = 'core.asgi.application'
 
 import re
 
-CHANNEL_LAYERS = {
-    "default": {
-        "BACKEND": "channels.layers.InMemoryChannelLayer",
-    },
+# memory: single process only; unix: workers on one host share a hub started
+# with `manage.py run_channel_hub`; redis: workers across hosts
+CHANNEL_LAYER_BACKEND = env('CHANNEL_LAYER_BACKEND', default='memory')
+CHANNEL_HUB_SOCKET = env('CHANNEL_HUB_SOCKET', default='/tmp/couplequest-channels.sock')
+CHANNEL_REDIS_URL = env('CHANNEL_REDIS_URL', default='redis://127.0.0.1:6379/0')
+
+if CHANNEL_LAYER_BACKEND == 'unix':
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "core.channel_layers.UnixSocketChannelLayer",
+            "CONFIG": {"path": CHANNEL_HUB_SOCKET},
+        },
+    }
+elif CHANNEL_LAYER_BACKEND == 'redis':
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels_redis.core.RedisChannelLayer",
+            "CONFIG": {"hosts": [CHANNEL_REDIS_URL]},
+        },
+    }
+else:
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels.layers.InMemoryChannelLayer",
+        },
+    }
+
+# Outbound frames buffered per WebSocket connection, and what to do when a
+# slow client fills the buffer: drop_oldest, coalesce (replace queued state
+# events of the same kind, then drop oldest) or disconnect
+WS_SEND_QUEUE_SIZE = env.int('WS_SEND_QUEUE_SIZE', default=100)
+WS_SEND_QUEUE_POLICY = env('WS_SEND_QUEUE_POLICY', default='drop_oldest')
+# Frames sent ahead of the client's last pong, for clients that answer pings;
+# beyond this they wait in the queue
+WS_SEND_WINDOW = env.int('WS_SEND_WINDOW', default=32)
+
+# Application-level heartbeat: ping every interval, close sockets that have
+# sent nothing at all for the idle timeout
+WS_PING_INTERVAL = env.int('WS_PING_INTERVAL', default=25)
+WS_IDLE_TIMEOUT = env.int('WS_IDLE_TIMEOUT', default=75)
+
+# WebSocket auth: how long a worker reuses a resolved (user, couple) per user id
+WS_AUTH_CACHE_TIMEOUT = env.int('WS_AUTH_CACHE_TIMEOUT', default=30)
+WS_AUTH_CACHE_SIZE = 10000
+
+# Presence: a connection counts as online this long after its last heartbeat.
+# Typing indicators go out at most once per debounce window and clear
+# themselves after the timeout
+PRESENCE_TTL = env.int('PRESENCE_TTL', default=60)
+TYPING_DEBOUNCE_SECONDS = 3
+TYPING_TIMEOUT_SECONDS = 6
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+def cache_config(var, location, max_entries):
+    cache_settings = env.cache(var, default=f'locmemcache://{location}')
+    if cache_settings['BACKEND'].endswith('LocMemCache'):
+        # LocMem culls entries at random once full (300 by default)
+        cache_settings.setdefault('OPTIONS', {}).setdefault('MAX_ENTRIES', max_entries)
+    return cache_settings
+
+
+# Rate limit counters and chat de-duplication keys get caches of their own,
+# so neither can push out the other's entries or the couple lookups.
+# The LocMem defaults only suit a single process: with more than one worker
+# (CHANNEL_LAYER_BACKEND unix or redis) point each of these at a shared cache,
+# e.g. redis://... or, for workers on one host, filecache:///var/tmp/...;
+# otherwise couple lookup invalidation and rate limits only reach one worker.
+# The chat cache is required to be shared and needs an atomic add (redis,
+# memcached or dbcache): a resend reaching another worker would otherwise be
+# broadcast under a second sequence number that is never stored
+CACHES = {
+    'default': cache_config('CACHE_URL', '', 10000),
+    'ratelimit': cache_config('RATELIMIT_CACHE_URL', 'ratelimit', 100000),
+    'chat': cache_config('CHAT_CACHE_URL', 'chat', 100000),
 }
+PROCESS_LOCAL_CACHES = sorted(
+    alias for alias, cache_settings in CACHES.items() if cache_settings['BACKEND'].endswith('LocMemCache')
+)
+if CHANNEL_LAYER_BACKEND != 'memory' and 'chat' in PROCESS_LOCAL_CACHES:
+    raise ImproperlyConfigured(
+        f"CHANNEL_LAYER_BACKEND={CHANNEL_LAYER_BACKEND} needs CHAT_CACHE_URL set to a cache "
+        "shared by all workers, for chat de-duplication"
+    )
+if CHANNEL_LAYER_BACKEND != 'memory' and PROCESS_LOCAL_CACHES:
+    warnings.warn(
+        f"CHANNEL_LAYER_BACKEND={CHANNEL_LAYER_BACKEND} runs several workers, but the "
+        f"{', '.join(PROCESS_LOCAL_CACHES)} cache(s) are process-local LocMem caches; "
+        "set CACHE_URL, RATELIMIT_CACHE_URL and CHAT_CACHE_URL to a shared cache"
+    )
+
+# How long a user -> active couple lookup stays cached (seconds)
+COUPLE_CACHE_TIMEOUT = env.int('COUPLE_CACHE_TIMEOUT', default=300)
+
+# Upper bound on how long a pairing status response stays cached (seconds)
+PAIRING_STATUS_CACHE_TIMEOUT = env.int('PAIRING_STATUS_CACHE_TIMEOUT', default=60)
+
+# Failed pairing attempts allowed per IP and per user in a sliding window (seconds)
+PAIRING_ATTEMPT_LIMIT = env.int('PAIRING_ATTEMPT_LIMIT', default=5)
+PAIRING_ATTEMPT_WINDOW = env.int('PAIRING_ATTEMPT_WINDOW', default=3600)
+
+# PairingAttempt audit rows are written in batches off the request path
+PAIRING_ATTEMPT_BATCH_SIZE = 100
+PAIRING_ATTEMPT_FLUSH_INTERVAL = 2.0
+
+# Raw PairingAttempt rows older than this are pruned (hourly summaries are kept)
+PAIRING_ATTEMPT_RETENTION_DAYS = env.int('PAIRING_ATTEMPT_RETENTION_DAYS', default=30)
+
+# Never-paired couples older than this are removed by sweep_pending_couples
+PENDING_COUPLE_STALE_HOURS = env.int('PENDING_COUPLE_STALE_HOURS', default=24)
+
+# In-process leaderboard: rebuild from the DB this often (seconds) and page size cap
+LEADERBOARD_RECONCILE_SECONDS = env.int('LEADERBOARD_RECONCILE_SECONDS', default=300)
+LEADERBOARD_MAX_LIMIT = 100
+
+# Chat messages are broadcast first and written in batches of this size,
+# or this many milliseconds after the first buffered message. While the
+# database is unreachable at most CHAT_BUFFER_MAX_PENDING are kept per worker
+CHAT_BUFFER_BATCH_SIZE = env.int('CHAT_BUFFER_BATCH_SIZE', default=50)
+CHAT_BUFFER_FLUSH_MS = env.int('CHAT_BUFFER_FLUSH_MS', default=200)
+CHAT_BUFFER_MAX_PENDING = env.int('CHAT_BUFFER_MAX_PENDING', default=10000)
+
+# Chat messages older than this are moved into compressed monthly blocks by archive_messages
+CHAT_ARCHIVE_AFTER_DAYS = env.int('CHAT_ARCHIVE_AFTER_DAYS', default=180)
+
+# Resumable chat sync: a reconnecting client gets the messages after its
+# last_seq in batches, or is told to reload history if it is further behind
+# than CHAT_SYNC_MAX_MESSAGES. Messages other workers have not written yet
+# are waited for up to CHAT_SYNC_WAIT_MS. Resent client message ids are
+# recognised for CHAT_DEDUPE_SECONDS through the 'chat' cache
+# (CHAT_CACHE_URL; make it a shared cache when running more than one worker)
+CHAT_SYNC_BATCH_SIZE = 100
+CHAT_SYNC_WAIT_MS = env.int('CHAT_SYNC_WAIT_MS', default=1000)
+CHAT_SYNC_MAX_MESSAGES = env.int('CHAT_SYNC_MAX_MESSAGES', default=2000)
+CHAT_DEDUPE_SECONDS = env.int('CHAT_DEDUPE_SECONDS', default=3600)
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
@@ -0,0 +1,56 @@
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    Small in-process cache whose entries expire `ttl` seconds after they
+    were set, evicting the least recently set entry beyond `maxsize`.
+    """
+
+    def __init__(self, ttl, maxsize=10000):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                return default
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, _MISSING)
+        return default if entry is _MISSING else entry[1]
+
+    def items(self):
+        """Live (key, value) pairs, dropping expired entries on the way"""
+        now = time.monotonic()
+        with self._lock:
+            for key in [key for key, (expires_at, _) in self._data.items() if expires_at < now]:
+                del self._data[key]
+            return [(key, value) for key, (_, value) in self._data.items()]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
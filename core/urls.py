@@ -7,6 +7,8 @@ from rest_framework import permissions
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
 
+from .views import metrics
+
 # Swagger schema view
 schema_view = get_schema_view(
     openapi.Info(
@@ -26,6 +28,7 @@ urlpatterns = [
     path('api/reward/', include('reward.urls')),
     path('api/user/', include('userProfile.urls')),
     path('api/task/', include('task.urls')),
+    path('api/metrics/', metrics, name='metrics'),
 
     # Swagger Url
     re_path(r'^swagger(?P<format>\.json|\.yaml)$', schema_view.without_ui(cache_timeout=0), name='schema-json'),
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Couple, PairingAttempt, CoupleMessage
+from .models import Couple, CoupleMembership, CoupleMessageArchive, CoupleReadState, PairingAttempt, PairingAttemptSummary, CoupleMessage
 
 @admin.register(Couple)
 class CoupleAdmin(admin.ModelAdmin):
@@ -14,10 +14,34 @@ class CoupleAdmin(admin.ModelAdmin):
     def has_add_permission(self, request):
         return True
     
+@admin.register(CoupleMembership)
+class CoupleMembershipAdmin(admin.ModelAdmin):
+    list_display = ('user', 'couple', 'role', 'updated_at')
+    list_filter = ('role',)
+    search_fields = ('user__email', 'user__username')
+    raw_id_fields = ('user', 'couple')
+
+@admin.register(CoupleMessageArchive)
+class CoupleMessageArchiveAdmin(admin.ModelAdmin):
+    list_display = ('couple', 'month', 'message_count', 'first_timestamp', 'last_timestamp')
+    raw_id_fields = ('couple',)
+    exclude = ('data',)
+
+@admin.register(CoupleReadState)
+class CoupleReadStateAdmin(admin.ModelAdmin):
+    list_display = ('user', 'couple', 'unread_count', 'last_read_at')
+    raw_id_fields = ('user', 'couple')
+
 @admin.register(PairingAttempt)
 class PairingAttemptAdmin(admin.ModelAdmin):
     list_display = ('ip_address', 'user', 'was_successful', 'attempted_at')
     list_filter = ('was_successful',)
     search_fields = ('ip_address', 'user__username')
 
+@admin.register(PairingAttemptSummary)
+class PairingAttemptSummaryAdmin(admin.ModelAdmin):
+    list_display = ('ip_address', 'hour', 'attempts', 'failures')
+    search_fields = ('ip_address',)
+    ordering = ('-hour',)
+
 admin.site.register(CoupleMessage)
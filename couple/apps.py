@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class CoupleConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'couple'
+
+    def ready(self):
+        import couple.signals
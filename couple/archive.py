@@ -0,0 +1,143 @@
+import zlib
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import msgpack
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.utils import timezone
+
+from .models import CoupleMessage, CoupleMessageArchive
+
+User = get_user_model()
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+
+# Fields of a packed message, in order
+_FIELDS = ('id', 'sender_id', 'content', 'timestamp', 'client_id', 'seq')
+
+
+def _to_micros(value):
+    return (value - _EPOCH) // _MICROSECOND
+
+
+def _from_micros(value):
+    return _EPOCH + value * _MICROSECOND
+
+
+def pack_messages(rows):
+    """Compress [(id, sender_id, content, timestamp, client_id, seq)] into a block"""
+    packed = [
+        [message_id, sender_id, content, _to_micros(timestamp), client_id, seq]
+        for message_id, sender_id, content, timestamp, client_id, seq in rows
+    ]
+    return zlib.compress(msgpack.packb(packed), 6)
+
+
+def unpack_messages(data):
+    """Inverse of pack_messages"""
+    return [
+        # Blocks written before sequence numbers existed have no seq
+        (message_id, sender_id, content, _from_micros(micros), client_id, seq[0] if seq else None)
+        for message_id, sender_id, content, micros, client_id, *seq in msgpack.unpackb(zlib.decompress(data))
+    ]
+
+
+def _month(timestamp):
+    return timezone.localdate(timestamp).replace(day=1)
+
+
+@transaction.atomic
+def _archive_month(couple_id, month, rows):
+    """Merge `rows` into the couple's block for `month` and delete them from CoupleMessage"""
+    block = CoupleMessageArchive.objects.select_for_update().filter(couple_id=couple_id, month=month).first()
+    if block is not None:
+        archived = {row[0]: row for row in unpack_messages(bytes(block.data))}
+        archived.update((row[0], row) for row in rows)
+        rows = sorted(archived.values(), key=lambda row: (row[3], row[0]))
+    else:
+        block = CoupleMessageArchive(couple_id=couple_id, month=month)
+
+    block.data = pack_messages(rows)
+    block.first_timestamp = rows[0][3]
+    block.last_timestamp = rows[-1][3]
+    block.message_count = len(rows)
+    block.last_seq = max((row[5] for row in rows if row[5] is not None), default=block.last_seq)
+    block.save()
+    CoupleMessage.objects.filter(id__in=[row[0] for row in rows]).delete()
+
+
+def archive_messages(cutoff, couple_ids=None):
+    """
+    Move every message older than `cutoff` into per-couple, per-month
+    blocks. Each block is written and its rows deleted in one transaction,
+    so an interrupted run can simply be repeated.
+    Returns (messages archived, blocks written).
+    """
+    old = CoupleMessage.objects.filter(timestamp__lt=cutoff)
+    if couple_ids is None:
+        couple_ids = old.order_by().values_list('couple_id', flat=True).distinct()
+
+    archived = blocks = 0
+    for couple_id in list(couple_ids):
+        months = {}
+        rows = (
+            old.filter(couple_id=couple_id)
+            .order_by('timestamp', 'id')
+            .values_list(*_FIELDS)
+        )
+        for row in rows.iterator(chunk_size=2000):
+            months.setdefault(_month(row[3]), []).append(row)
+        for month, month_rows in months.items():
+            _archive_month(couple_id, month, month_rows)
+            archived += len(month_rows)
+            blocks += 1
+    return archived, blocks
+
+
+def _messages(rows):
+    senders = User.objects.in_bulk({row[1] for row in rows})
+    messages = []
+    for message_id, sender_id, content, timestamp, client_id, seq in rows:
+        message = CoupleMessage(
+            id=message_id,
+            sender_id=sender_id,
+            content=content,
+            timestamp=timestamp,
+            client_id=client_id,
+            seq=seq
+        )
+        if sender_id in senders:
+            message.sender = senders[sender_id]
+        messages.append(message)
+    return messages
+
+
+def archived_page(couple_id, before=None, after=None, limit=50):
+    """
+    Archived messages for a couple, newest first, mirroring
+    messages.message_page: older than the `before` position or newer than
+    the `after` position, each a (timestamp, id) pair. Blocks are read one
+    month at a time until the page is full.
+    """
+    blocks = CoupleMessageArchive.objects.filter(couple_id=couple_id).only('data')
+    if after is not None:
+        blocks = blocks.filter(last_timestamp__gte=after[0]).order_by('month')
+        keep, newest_first = (lambda key: key > after), False
+    else:
+        if before is not None:
+            blocks = blocks.filter(first_timestamp__lte=before[0])
+        blocks = blocks.order_by('-month')
+        keep, newest_first = (lambda key: before is None or key < before), True
+
+    rows = []
+    for block in blocks.iterator(chunk_size=4):
+        matching = [row for row in unpack_messages(bytes(block.data)) if keep((row[3], row[0]))]
+        matching.sort(key=lambda row: (row[3], row[0]), reverse=newest_first)
+        rows.extend(matching[:limit - len(rows)])
+        if len(rows) >= limit:
+            break
+
+    if not newest_first:
+        rows.reverse()
+    return _messages(rows)
@@ -0,0 +1,65 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.utils import timezone
+
+from core.batching import BatchWriter
+from core.db import increment_or_create
+from core.ratelimit import SlidingWindowLimiter
+from .models import PairingAttempt, PairingAttemptSummary
+
+pairing_limiter = SlidingWindowLimiter(
+    'pairing',
+    limit=settings.PAIRING_ATTEMPT_LIMIT,
+    window=settings.PAIRING_ATTEMPT_WINDOW,
+    cache_alias='ratelimit'
+)
+
+
+def summarize_pairing_attempts(attempts):
+    """Add a batch of attempts to the hourly per-IP summary table"""
+    counts = defaultdict(lambda: [0, 0])
+    for attempt in attempts:
+        hour = attempt.attempted_at.replace(minute=0, second=0, microsecond=0)
+        totals = counts[(attempt.ip_address, hour)]
+        totals[0] += 1
+        if not attempt.was_successful:
+            totals[1] += 1
+
+    for (ip, hour), (total, failures) in counts.items():
+        increment_or_create(
+            PairingAttemptSummary,
+            {'ip_address': ip, 'hour': hour},
+            {'attempts': total, 'failures': failures}
+        )
+
+
+# PairingAttempt rows are an audit trail only; nothing reads them on the request path
+pairing_attempt_writer = BatchWriter(
+    PairingAttempt,
+    batch_size=settings.PAIRING_ATTEMPT_BATCH_SIZE,
+    flush_interval=settings.PAIRING_ATTEMPT_FLUSH_INTERVAL,
+    on_flush=summarize_pairing_attempts
+)
+
+
+def _limiter_keys(user, ip):
+    return (f'ip:{ip}', f'user:{user.pk}')
+
+
+def pairing_attempts_blocked(user, ip):
+    """True if the IP or the user has too many recent failed attempts"""
+    return pairing_limiter.is_limited(*_limiter_keys(user, ip))
+
+
+def record_pairing_attempt(user, ip, code, successful=False):
+    """Queue the audit row and count failures against the IP and the user"""
+    pairing_attempt_writer.add(PairingAttempt(
+        user=user,
+        ip_address=ip,
+        code_attempt=str(code or '')[:6],
+        was_successful=successful,
+        attempted_at=timezone.now()
+    ))
+    if not successful:
+        pairing_limiter.hit(*_limiter_keys(user, ip))
@@ -0,0 +1,325 @@
+import asyncio
+import json
+import os
+import time
+from collections import deque
+
+import msgpack
+from asgiref.sync import async_to_sync
+from channels.exceptions import StopConsumer
+from channels.layers import get_channel_layer
+from django.conf import settings
+
+from core.metrics import registry
+from core.middleware import JWT_SUBPROTOCOL
+
+# Clients that offer this WebSocket subprotocol get binary msgpack frames
+MSGPACK_SUBPROTOCOL = 'msgpack'
+
+DROP_OLDEST = 'drop_oldest'
+COALESCE = 'coalesce'
+DISCONNECT = 'disconnect'
+SEND_QUEUE_POLICIES = (DROP_OLDEST, COALESCE, DISCONNECT)
+
+# Close code sent to clients that fell too far behind under the disconnect policy
+CLOSE_TOO_SLOW = 4008
+# Close code sent to clients that stopped answering pings
+CLOSE_IDLE = 4009
+
+queue_depth = registry.gauge('ws_send_queue_depth', "Frames waiting to be sent, per connection")
+frames_dropped = registry.counter('ws_send_queue_dropped_total', "Frames dropped or coalesced on full send queues")
+slow_disconnects = registry.counter('ws_send_queue_disconnects_total', "Connections closed for overflowing their send queue")
+open_connections = registry.gauge('ws_open_connections', "Accepted WebSocket connections open on this worker")
+idle_disconnects = registry.counter('ws_idle_disconnects_total', "Connections closed for not answering pings")
+window_stalls = registry.counter('ws_send_window_stalls_total', "Times a connection's send window filled up")
+
+
+def encode_event(event, coalesce=None, meta=None):
+    """
+    Group message carrying `event` already encoded as JSON text and msgpack
+    bytes, so every member socket forwards the same payload instead of
+    serializing it again. Queued events with the same `coalesce` key
+    replace each other when a client falls behind. `meta` travels alongside
+    for the receiving consumers and is never sent to clients.
+    """
+    return {
+        'type': event['type'],
+        'text': json.dumps(event),
+        'bytes': msgpack.packb(event),
+        'coalesce': coalesce,
+        'meta': meta,
+    }
+
+
+async def group_broadcast(group, event, channel_layer=None, coalesce=None, meta=None):
+    channel_layer = channel_layer or get_channel_layer()
+    await channel_layer.group_send(group, encode_event(event, coalesce, meta))
+
+
+def broadcast(group, event, coalesce=None):
+    """group_broadcast for synchronous code"""
+    async_to_sync(group_broadcast)(group, event, coalesce=coalesce)
+
+
+class SendQueue:
+    """
+    Bounded outbound frame queue for one connection. put() applies the
+    overflow policy and returns False when the connection should be
+    dropped instead.
+    """
+
+    def __init__(self, maxsize, policy):
+        if policy not in SEND_QUEUE_POLICIES:
+            raise ValueError(f"Unknown send queue policy: {policy}")
+        self.maxsize = maxsize
+        self.policy = policy
+        self.dropped = 0
+        self._frames = deque()
+        self._ready = asyncio.Event()
+
+    def __len__(self):
+        return len(self._frames)
+
+    def put(self, frame, key=None):
+        if key is not None and self.policy == COALESCE:
+            for i, (queued_key, _) in enumerate(self._frames):
+                if queued_key == key:
+                    self._frames[i] = (key, frame)
+                    self.dropped += 1
+                    return True
+
+        if len(self._frames) >= self.maxsize:
+            if self.policy == DISCONNECT:
+                return False
+            self._frames.popleft()
+            self.dropped += 1
+
+        self._frames.append((key, frame))
+        self._ready.set()
+        return True
+
+    async def get(self):
+        while not self._frames:
+            self._ready.clear()
+            await self._ready.wait()
+        return self._frames.popleft()[1]
+
+
+class BroadcastConsumerMixin:
+    """
+    For AsyncWebsocketConsumer subclasses: negotiates the msgpack
+    subprotocol and forwards pre-encoded group events through a bounded
+    per-connection send queue, so a slow client can only hold
+    `send_queue_size` frames in worker memory.
+
+    The server's send() gives no backpressure (Daphne buffers writes in
+    the transport). Clients that answer the application-level ping
+    {"type": "ping", "id": n} with {"type": "pong", "id": n} (id optional,
+    pongs answer pings in order) opt in to a send window from their first
+    pong on: at most WS_SEND_WINDOW frames go out beyond the last ping the
+    client has answered. If such a client stops reading it stops answering,
+    its frames back up in the send queue and the overflow policy applies.
+    Clients that never pong are sent to as fast as the queue drains.
+
+    Accepted connections are also pinged every WS_PING_INTERVAL seconds.
+    One that sends nothing at all for WS_IDLE_TIMEOUT seconds is closed
+    and leaves its groups right away, without waiting for the server to
+    notice the dead socket.
+    """
+    binary = False
+    send_queue_size = None
+    send_queue_policy = None
+    _accepted = False
+    _released = False
+
+    async def accept_client(self):
+        # Browsers fail the handshake if they offered subprotocols and none is selected
+        offered = self.scope.get('subprotocols', ())
+        if MSGPACK_SUBPROTOCOL in offered:
+            self.binary = True
+            await self.accept(subprotocol=MSGPACK_SUBPROTOCOL)
+        elif JWT_SUBPROTOCOL in offered:
+            await self.accept(subprotocol=JWT_SUBPROTOCOL)
+        else:
+            await self.accept()
+
+        self._send_queue = SendQueue(
+            self.send_queue_size or settings.WS_SEND_QUEUE_SIZE,
+            self.send_queue_policy or settings.WS_SEND_QUEUE_POLICY
+        )
+        self._metric_labels = {'consumer': type(self).__name__, 'channel': self.channel_name}
+        self._send_window = settings.WS_SEND_WINDOW
+        # Frames sent, the count the client has confirmed, and unanswered pings as (id, frames sent before it)
+        self._window_enabled = False
+        self._frames_sent = self._frames_confirmed = 0
+        self._pings = deque()
+        self._ping_id = 0
+        self._window_open = asyncio.Event()
+        self._timer_tasks = set()
+        loop = asyncio.get_running_loop()
+        self._sender = loop.create_task(self._drain_send_queue())
+
+        self._accepted = True
+        open_connections.inc(consumer=type(self).__name__, worker=os.getpid())
+        self._last_received = time.monotonic()
+        self._heartbeat = loop.create_task(self._ping_until_idle())
+
+    def call_later(self, delay, callback, *args):
+        """
+        loop.call_later for a coroutine function. The task it starts is
+        referenced until done, so it can't be garbage collected midway.
+        """
+        return asyncio.get_running_loop().call_later(delay, self._start_task, callback, *args)
+
+    def _start_task(self, callback, *args):
+        task = asyncio.get_running_loop().create_task(callback(*args))
+        self._timer_tasks.add(task)
+        task.add_done_callback(self._timer_tasks.discard)
+
+    def decode_client(self, text_data=None, bytes_data=None):
+        """Incoming frame as a dict, in whichever framing the client uses"""
+        if bytes_data is not None:
+            return msgpack.unpackb(bytes_data)
+        return json.loads(text_data)
+
+    async def forward(self, event):
+        if 'text' not in event:
+            # Sent with a plain group_send rather than group_broadcast
+            event = encode_event(event)
+        frame = event['bytes'] if self.binary else event['text']
+
+        queue = getattr(self, '_send_queue', None)
+        if queue is None:
+            return
+        dropped = queue.dropped
+        if not queue.put(frame, event.get('coalesce')):
+            slow_disconnects.inc(consumer=type(self).__name__)
+            await self.release(CLOSE_TOO_SLOW)
+            return
+        if queue.dropped != dropped:
+            frames_dropped.inc(queue.dropped - dropped, consumer=type(self).__name__, policy=queue.policy)
+        queue_depth.set(len(queue), **self._metric_labels)
+
+    async def send_event(self, event):
+        """
+        Send one event to this client now, bypassing the send queue so it
+        cannot be dropped. It never waits for the send window, but counts
+        towards it, so queued frames wait until it has been confirmed.
+        """
+        await self._send_frame(msgpack.packb(event) if self.binary else json.dumps(event))
+
+    async def _send_frame(self, frame):
+        self._frames_sent += 1
+        if self.binary:
+            await self.send(bytes_data=frame)
+        else:
+            await self.send(text_data=frame)
+
+    async def _send_ping(self):
+        self._ping_id += 1
+        self._pings.append((self._ping_id, self._frames_sent))
+        ping = {'type': 'ping', 'id': self._ping_id}
+        if self.binary:
+            await self.send(bytes_data=msgpack.packb(ping))
+        else:
+            await self.send(text_data=json.dumps(ping))
+
+    def acknowledge(self, data):
+        """Handle a pong from the client; True if `data` was one"""
+        if not isinstance(data, dict) or data.get('type') != 'pong':
+            return False
+        ping_id = data.get('id')
+        if not self._window_enabled:
+            # The window starts here; nothing sent so far was held back by it
+            self._window_enabled = True
+            self._frames_confirmed = self._frames_sent
+        while self._pings:
+            answered, frames = self._pings.popleft()
+            self._frames_confirmed = max(self._frames_confirmed, frames)
+            if ping_id is None or answered >= ping_id:
+                break
+        self._window_open.set()
+        return True
+
+    async def _wait_for_window(self):
+        if not self._window_enabled:
+            return
+        half = max(self._send_window // 2, 1)
+        last_ping = self._pings[-1][1] if self._pings else self._frames_confirmed
+        if self._frames_sent - last_ping >= half:
+            # Ask for confirmation well before the window runs out
+            await self._send_ping()
+        if self._frames_sent - self._frames_confirmed < self._send_window:
+            return
+        window_stalls.inc(consumer=type(self).__name__)
+        while self._frames_sent - self._frames_confirmed >= self._send_window:
+            self._window_open.clear()
+            await self._window_open.wait()
+
+    async def _drain_send_queue(self):
+        queue = self._send_queue
+        while True:
+            frame = await queue.get()
+            if self._send_queue is not queue:
+                return
+            await self._wait_for_window()
+            if self._send_queue is not queue:
+                return
+            queue_depth.set(len(queue), **self._metric_labels)
+            await self._send_frame(frame)
+
+    def _stop_sending(self):
+        sender = getattr(self, '_sender', None)
+        if sender is not None:
+            sender.cancel()
+            queue_depth.remove(**self._metric_labels)
+        self._send_queue = self._sender = None
+
+    async def _ping_until_idle(self):
+        interval, timeout = settings.WS_PING_INTERVAL, settings.WS_IDLE_TIMEOUT
+        while True:
+            await asyncio.sleep(interval)
+            if time.monotonic() - self._last_received > timeout:
+                idle_disconnects.inc(consumer=type(self).__name__)
+                self._heartbeat = None
+                await self.release(CLOSE_IDLE)
+                return
+            await self._send_ping()
+
+    async def release(self, code):
+        """Close the socket and leave groups now rather than on the server's disconnect"""
+        if self._released:
+            return
+        self._stop_sending()
+        await self.close(code=code)
+        try:
+            await self.websocket_disconnect({'type': 'websocket.disconnect', 'code': code})
+        except StopConsumer:
+            pass
+
+    async def websocket_receive(self, message):
+        self._last_received = time.monotonic()
+        await super().websocket_receive(message)
+
+    async def websocket_disconnect(self, message):
+        # release() may already have run the disconnect handling
+        if self._released:
+            raise StopConsumer()
+        self._released = True
+        await super().websocket_disconnect(message)
+
+    def _stop_heartbeat(self):
+        heartbeat = getattr(self, '_heartbeat', None)
+        if heartbeat is not None:
+            heartbeat.cancel()
+        self._heartbeat = None
+
+    async def __call__(self, scope, receive, send):
+        # Also covers the consumer being cancelled without a disconnect message
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self._stop_sending()
+            self._stop_heartbeat()
+            if self._accepted:
+                open_connections.dec(consumer=type(self).__name__, worker=os.getpid())
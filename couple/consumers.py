@@ -1,17 +1,39 @@
-import json
-from channels.generic.websocket import AsyncJsonWebsocketConsumer, AsyncWebsocketConsumer
+import asyncio
+import time
+import uuid
+from urllib.parse import parse_qs
+from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
+from django.conf import settings
 from django.contrib.auth.models import AnonymousUser
-from .models import Couple, CoupleMessage
-from django.db.models import Q
+from .models import CoupleMessage
+from .couple import get_user_couple_id
+from .messages import (
+    anext_seq, claim_client_id, current_seq, message_buffer, messages_since, record_client_seq,
+    sync_needs_reload
+)
+from .broadcast import COALESCE, BroadcastConsumerMixin, encode_event, group_broadcast
+from .presence import TYPING_DEBOUNCE_SECONDS, TYPING_TIMEOUT_SECONDS, presence, presence_event, typing_event
 from django.utils import timezone
-from asgiref.sync import sync_to_async
 
 
-class CoupleConsumer(AsyncJsonWebsocketConsumer):
+async def resolve_couple_id(scope):
+    """The connecting user's active couple id, usually already set by JWTAuthMiddleware"""
+    couple_id = scope.get('couple_id')
+    if couple_id is None:
+        couple_id = await database_sync_to_async(get_user_couple_id)(scope['user'])
+    return couple_id
+
+
+class CoupleConsumer(BroadcastConsumerMixin, AsyncWebsocketConsumer):
+    # Couple updates are mostly state; a client that falls behind only needs the latest
+    send_queue_policy = COALESCE
+    _typing_sent_at = None
+    _typing_timer = None
+    _presence_timer = None
+
     async def connect(self):
         self.user = self.scope["user"]
-        self.accept()
 
         if isinstance(self.user, AnonymousUser):
             await self.close()
@@ -19,10 +41,11 @@ class CoupleConsumer(AsyncJsonWebsocketConsumer):
         
 
         # Get the couple group name
-        self.couple = await self.get_user_couple()
-        if not self.couple:
+        self.couple_id = await resolve_couple_id(self.scope)
+        if not self.couple_id:
             await self.close()
             return
+        self.couple_group_name = f'couple_{self.couple_id}'
         
         # join couple group
         await self.channel_layer.group_add(
@@ -30,94 +53,274 @@ class CoupleConsumer(AsyncJsonWebsocketConsumer):
             self.channel_name
         )
 
-        await self.accept()
+        await self.accept_client()
+
+        # Presence and typing live in memory only and never touch the database
+        presence.touch(self.couple_id, self.user.id, self.channel_name)
+        self._watch_presence()
+        for user_id, online, last_seen in presence.members(self.couple_id):
+            if user_id != self.user.id:
+                await self.forward(encode_event(presence_event(user_id, online, last_seen)))
+        # Members connected to other workers answer with their own state
+        await self._broadcast_presence(True, announce=True)
 
     async def disconnect(self, close_code):
         # Leave coupe group
         if hasattr(self, 'couple_group_name'):
+            if self._presence_timer is not None:
+                self._presence_timer.cancel()
+            await self._set_typing(False)
+            if presence.leave(self.couple_id, self.user.id, self.channel_name):
+                await self._broadcast_presence(False)
             await self.channel_layer.group_discard(
                 self.couple_group_name,
                 self.channel_name
             )
 
-    @database_sync_to_async
-    def get_user_couple(self):
-        return Couple.objects.filter(
-            (Q(user1=self.user) | Q(user2=self.user)),
-            is_active=True
-        ).first()
-    
-    async def receive(self, text_data):
-        # Handle incoming messages (if needed)
-        pass
+    async def receive(self, text_data=None, bytes_data=None):
+        try:
+            data = self.decode_client(text_data, bytes_data)
+        except ValueError:
+            return
+        if self.acknowledge(data):
+            return
+        kind = data.get('type') if isinstance(data, dict) else None
+
+        if kind == 'heartbeat':
+            came_back = presence.touch(self.couple_id, self.user.id, self.channel_name)
+            self._watch_presence()
+            # Other workers forget us after PRESENCE_TTL unless reminded
+            if came_back or presence.announce_due(self.couple_id, self.user.id):
+                await self._broadcast_presence(True)
+        elif kind == 'typing':
+            presence.touch(self.couple_id, self.user.id, self.channel_name)
+            self._watch_presence()
+            await self._set_typing(bool(data.get('typing', True)))
 
     async def couple_update(self, event):
+        meta = event.get('meta') or {}
+        if 'presence' in meta:
+            user_id, online, last_seen = meta['presence']
+            if user_id == self.user.id:
+                return
+            presence.observe(self.couple_id, user_id, online, last_seen)
+            if meta.get('announce'):
+                await self._broadcast_presence(True)
+        elif meta.get('typing') == self.user.id:
+            return
+
         # Send updates to the client
-        await self.send(text_data=json.dumps(event))
+        await self.forward(event)
 
+    def _watch_presence(self):
+        """(Re)arm the check that reports us offline once our presence lapses without a heartbeat"""
+        if self._presence_timer is not None:
+            self._presence_timer.cancel()
+        self._presence_timer = self.call_later(presence.ttl + 1, self._presence_lapsed)
 
+    async def _presence_lapsed(self):
+        self._presence_timer = None
+        # Still online if another connection, here or on another worker, kept it alive
+        if not presence.state(self.couple_id, self.user.id)[0]:
+            await self._broadcast_presence(False)
+
+    async def _broadcast_presence(self, online, announce=False):
+        user_id = self.user.id
+        if online:
+            presence.announced(self.couple_id, user_id)
+        last_seen = presence.state(self.couple_id, user_id)[1]
+        await group_broadcast(
+            self.couple_group_name,
+            presence_event(user_id, online, last_seen),
+            channel_layer=self.channel_layer,
+            coalesce=f'presence:{user_id}',
+            meta={'presence': [user_id, online, last_seen], 'announce': announce}
+        )
 
-class ChatConsumer(AsyncWebsocketConsumer):
+    async def _set_typing(self, typing):
+        """
+        Debounced typing state: "typing" goes out at most once per
+        TYPING_DEBOUNCE_SECONDS and turns itself off after
+        TYPING_TIMEOUT_SECONDS without another typing event.
+        """
+        if self._typing_timer is not None:
+            self._typing_timer.cancel()
+            self._typing_timer = None
+
+        now = time.monotonic()
+        if typing:
+            self._typing_timer = self.call_later(TYPING_TIMEOUT_SECONDS, self._set_typing, False)
+            if self._typing_sent_at is not None and now - self._typing_sent_at < TYPING_DEBOUNCE_SECONDS:
+                return
+            self._typing_sent_at = now
+        else:
+            if self._typing_sent_at is None:
+                return
+            self._typing_sent_at = None
+
+        await group_broadcast(
+            self.couple_group_name,
+            typing_event(self.user.id, typing),
+            channel_layer=self.channel_layer,
+            coalesce=f'typing:{self.user.id}',
+            meta={'typing': self.user.id}
+        )
+
+
+
+class ChatConsumer(BroadcastConsumerMixin, AsyncWebsocketConsumer):
     async def connect(self):
         self.user = self.scope["user"]
-        self.accept()
-
-        self.couple_id = self.scope['url_route']['kwargs']['couple_id']
-        self.room_group_name = f'chat_{self.couple_id}'
         
-        if self.scope["user"] == AnonymousUser():
+        if isinstance(self.user, AnonymousUser):
             await self.close()
             return
 
+        # Membership is checked once here; receive() trusts it from then on
+        self.couple_id = await resolve_couple_id(self.scope)
+        requested = self.scope['url_route']['kwargs'].get('couple_id')
+        if not self.couple_id or (requested is not None and requested != self.couple_id):
+            await self.close()
+            return
+        self.room_group_name = f'chat_{self.couple_id}'
+        self.sender_id = self.user.id
+        self.sender_name = self.user.username
+
         await self.channel_layer.group_add(
             self.room_group_name,
             self.channel_name
         )
-        await self.accept()
+        await self.accept_client()
+
+        # Reconnecting clients may pass ?last_seq=N instead of sending a sync frame
+        last_seq = parse_qs(self.scope.get('query_string', b'').decode()).get('last_seq')
+        if last_seq:
+            await self.sync(last_seq[0])
 
     async def disconnect(self, close_code):
-        await self.channel_layer.group_discard(
-            self.room_group_name,
-            self.channel_name
-        )
+        if hasattr(self, 'room_group_name'):
+            await self.channel_layer.group_discard(
+                self.room_group_name,
+                self.channel_name
+            )
 
-    async def receive(self, text_data):
+    async def receive(self, text_data=None, bytes_data=None):
         try:
-            data = json.loads(text_data)
+            data = self.decode_client(text_data, bytes_data)
+            if self.acknowledge(data):
+                return
+            if data.get('type') == 'sync':
+                await self.sync(data.get('last_seq'))
+                return
+
             message_content = data.get('message')
             
             if not message_content:
                 return
 
-            # Save message to database
-            message = await self.save_message(
-                user=self.scope["user"],
-                content=message_content
+            client_id = data.get('client_id')
+            if client_id:
+                client_id = str(client_id)[:64]
+                seq = await claim_client_id(self.couple_id, client_id)
+                if seq is not None:
+                    # A resend of a message we already have; confirm it to the sender only
+                    await self.send_event({
+                        "type": "chat_ack",
+                        "message_id": client_id,
+                        "seq": seq or None,
+                        "duplicate": True
+                    })
+                    return
+
+            message = CoupleMessage(
+                couple_id=self.couple_id,
+                sender_id=self.sender_id,
+                content=message_content,
+                client_id=client_id or uuid.uuid4().hex,
+                seq=await anext_seq(self.couple_id),
+                timestamp=timezone.now()
             )
+            if client_id:
+                await record_client_seq(self.couple_id, client_id, message.seq)
             
-            # Broadcast to group
-            await self.channel_layer.group_send(
+            # Broadcast to group first, the row is written behind
+            await group_broadcast(
                 self.room_group_name,
-                {
-                    "type": "chat_message",
-                    "message": message.content,
-                    "sender": message.sender.username,
-                    "timestamp": message.timestamp.isoformat(),
-                    "message_id": message.id
-                }
+                self.message_event(message, self.sender_name),
+                channel_layer=self.channel_layer
             )
+            message_buffer.add(message)
         except Exception as e:
             print(f"Error processing message: {str(e)}")
 
     async def chat_message(self, event):
-        await self.send(text_data=json.dumps(event))
-
-    @sync_to_async
-    def save_message(self, user, content):
-        from .models import Couple
-        couple = Couple.objects.get(id=self.couple_id)
-        return CoupleMessage.objects.create(
-            couple=couple,
-            sender=user,
-            content=content
-        )
\ No newline at end of file
+        await self.forward(event)
+
+    @staticmethod
+    def message_event(message, sender_name):
+        return {
+            "type": "chat_message",
+            "message": message.content,
+            "sender": sender_name,
+            "timestamp": message.timestamp.isoformat(),
+            "message_id": message.client_id or str(message.id),
+            "seq": message.seq
+        }
+
+    async def sync(self, last_seq):
+        """
+        Stream the messages numbered after `last_seq` as chat_sync frames of
+        up to CHAT_SYNC_BATCH_SIZE messages, the last one marked done. Live
+        messages keep arriving meanwhile; seq is unique per couple, so
+        clients de-duplicate by it. A client too far behind gets
+        {"reload": true} and should fetch history over HTTP instead.
+        """
+        try:
+            last_seq = max(int(last_seq), 0)
+        except (TypeError, ValueError):
+            return
+        # This socket is already in the group, so anything numbered after
+        # `target` reaches it live; everything up to it is replayed here
+        target = await database_sync_to_async(current_seq)(self.couple_id)
+        await message_buffer.flush()
+
+        if await database_sync_to_async(sync_needs_reload)(self.couple_id, last_seq, settings.CHAT_SYNC_MAX_MESSAGES):
+            await self.send_event({"type": "chat_sync", "messages": [], "done": True, "reload": True})
+            return
+
+        batch_size = settings.CHAT_SYNC_BATCH_SIZE
+        deadline = None
+        done = False
+        while last_seq < target:
+            messages = await database_sync_to_async(messages_since)(
+                self.couple_id, last_seq, min(batch_size, target - last_seq)
+            )
+            # Only send an unbroken run: a missing number may still be in another worker's buffer
+            run = []
+            for message in messages:
+                if message.seq != last_seq + len(run) + 1:
+                    break
+                run.append(message)
+
+            if run:
+                last_seq = run[-1].seq
+                done = last_seq >= target
+                # One batch at a time, so at most CHAT_SYNC_BATCH_SIZE messages are loaded at once
+                await self.send_event({
+                    "type": "chat_sync",
+                    "messages": [self.message_event(message, message.sender.username) for message in run],
+                    "done": done
+                })
+                continue
+
+            now = time.monotonic()
+            if deadline is None:
+                deadline = now + settings.CHAT_SYNC_WAIT_MS / 1000
+            if now >= deadline:
+                # Numbered but never written (a resend caught only by the database, or a dead letter)
+                last_seq = messages[0].seq - 1 if messages else target
+                continue
+            await asyncio.sleep(message_buffer.flush_interval)
+
+        if not done:
+            await self.send_event({"type": "chat_sync", "messages": [], "done": True})
@@ -1,10 +1,192 @@
-from django.shortcuts import get_object_or_404
-from .models import Couple
-from django.db.models import Q
+import hashlib
+import json
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Case, Count, F, Max, Min, Q, When
+from django.dispatch import Signal
+from django.utils import timezone
+from django.utils.http import quote_etag
+
+from .models import Couple, CoupleMembership
+
+COUPLE_CACHE_TIMEOUT = getattr(settings, 'COUPLE_CACHE_TIMEOUT', 300)
+PAIRING_STATUS_CACHE_TIMEOUT = getattr(settings, 'PAIRING_STATUS_CACHE_TIMEOUT', 60)
+
+# Cached value meaning "user has no active couple" (None means cache miss)
+_NO_COUPLE = 0
+
+# Attribute used to memoize the lookup on the user object for one request
+_REQUEST_ATTR = '_active_couple_id'
+
+# Sent with `user_ids` whenever their couple lookups are invalidated, so
+# other per-process caches (e.g. WebSocket identities) can follow
+user_couple_changed = Signal()
+
+_stats_lock = threading.Lock()
+_stats = {
+    'request_hits': 0, 'hits': 0, 'misses': 0, 'invalidations': 0,
+    'status_hits': 0, 'status_misses': 0,
+}
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def get_couple_cache_stats():
+    """Snapshot of the couple lookup / pairing status cache counters for this process"""
+    with _stats_lock:
+        return dict(_stats)
+
+
+def _version_key(user_id):
+    return f'couple:user:{user_id}:version'
+
+
+def _current_version(user_id):
+    key = _version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        # Seed with a timestamp so an evicted version never resurrects old entries
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def _bump_version(user_id):
+    key = _version_key(user_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), timeout=None)
+
+
+def _user_id(user):
+    return getattr(user, 'pk', user)
+
+
+def get_user_couple_id(user):
+    """Get the id of the user's active couple without loading the couple"""
+    if not getattr(user, 'is_authenticated', False):
+        return None
+
+    if hasattr(user, _REQUEST_ATTR):
+        _count('request_hits')
+        return getattr(user, _REQUEST_ATTR)
+
+    key = f'couple:user:{user.pk}:v{_current_version(user.pk)}'
+    couple_id = cache.get(key)
+    if couple_id is None:
+        _count('misses')
+        couple_id = CoupleMembership.objects.filter(
+            user=user,
+            couple__is_active=True
+        ).values_list('couple_id', flat=True).first() or _NO_COUPLE
+        cache.set(key, couple_id, COUPLE_CACHE_TIMEOUT)
+    else:
+        _count('hits')
+
+    couple_id = couple_id or None
+    setattr(user, _REQUEST_ATTR, couple_id)
+    return couple_id
+
 
 def get_user_couple(user):
     """Safely get the active couple for a user"""
-    return Couple.objects.filter(
-        (Q(user1=user) | Q(user2=user)),
+    couple_id = get_user_couple_id(user)
+    if not couple_id:
+        return None
+    return Couple.objects.select_related('user1', 'user2').filter(
+        id=couple_id,
         is_active=True
-    ).first()
\ No newline at end of file
+    ).first()
+
+
+def _status_key(user_id):
+    return f'couple:status:{user_id}:v{_current_version(user_id)}'
+
+
+def _compute_pairing_status(user):
+    now = timezone.now()
+    pending = Q(is_active=False, pairing_code_expires__gt=now)
+    active = Q(is_active=True)
+
+    # Active couple, partner, invite and code state in a single query
+    row = Couple.objects.filter(Q(user1=user) | Q(user2=user)).aggregate(
+        couple_id=Max('id', filter=active),
+        partner_username=Max(
+            Case(When(user1=user, then=F('user2__username')), default=F('user1__username')),
+            filter=active
+        ),
+        pending_invites=Count('id', filter=pending & Q(user2=user)),
+        code_expires_at=Max('pairing_code_expires', filter=pending & Q(user1=user)),
+        next_expiry=Min('pairing_code_expires', filter=pending),
+    )
+
+    data = {
+        'is_paired': row['couple_id'] is not None,
+        'couple_id': str(row['couple_id']) if row['couple_id'] else None,
+        'partner_username': row['partner_username'],
+        'pending_invite': row['pending_invites'] > 0,
+        'pending_code': row['code_expires_at'] is not None,
+        'code_expires_at': row['code_expires_at'].isoformat() if row['code_expires_at'] else None,
+    }
+
+    # Don't serve a pending state past the moment it expires
+    timeout = PAIRING_STATUS_CACHE_TIMEOUT
+    if row['next_expiry']:
+        timeout = max(0, min(timeout, int((row['next_expiry'] - now).total_seconds())))
+    return data, timeout
+
+
+def get_pairing_status(user):
+    """
+    Pairing status for the status endpoint plus its ETag, cached per user.
+    Shares the per-user version with the couple lookup, so anything that
+    invalidates one invalidates both.
+    """
+    key = _status_key(user.pk)
+    cached = cache.get(key)
+    if cached is not None:
+        _count('status_hits')
+        return cached
+
+    _count('status_misses')
+    data, timeout = _compute_pairing_status(user)
+    etag = quote_etag(hashlib.md5(
+        json.dumps(data, sort_keys=True).encode(), usedforsecurity=False
+    ).hexdigest())
+    if timeout:
+        cache.set(key, (data, etag), timeout)
+    return data, etag
+
+
+def invalidate_user_couple(*users):
+    """
+    Drop cached couple lookups and pairing status for the given users
+    (instances or ids).
+    Versions are bumped again on commit so a concurrent request can't
+    re-cache the pre-commit state.
+    """
+    user_ids = set()
+    for user in users:
+        if user is None:
+            continue
+        if hasattr(user, _REQUEST_ATTR):
+            delattr(user, _REQUEST_ATTR)
+        user_ids.add(_user_id(user))
+
+    def bump():
+        for user_id in user_ids:
+            _bump_version(user_id)
+            _count('invalidations')
+        user_couple_changed.send(sender=None, user_ids=user_ids)
+
+    bump()
+    if connection.in_atomic_block:
+        transaction.on_commit(bump)
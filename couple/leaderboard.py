@@ -0,0 +1,291 @@
+import logging
+import random
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Sum
+from django.utils import timezone
+
+from core.db import increment_or_create
+from .models import Couple, CouplePointsDaily
+
+logger = logging.getLogger(__name__)
+
+LEADERBOARD_RECONCILE_SECONDS = getattr(settings, 'LEADERBOARD_RECONCILE_SECONDS', 300)
+
+
+class _Node:
+    __slots__ = ('key', 'next', 'width')
+
+    def __init__(self, key, level):
+        self.key = key
+        self.next = [None] * level
+        # Number of positions skipped by each forward link
+        self.width = [1] * level
+
+
+class RankedSkipList:
+    """
+    Indexable skip list: sorted keys with O(log n) insert, remove,
+    rank-of-key and key-at-rank. Positions are 1-based; the head sits at 0
+    and a missing link points at the virtual end (size + 1).
+    """
+    MAX_LEVEL = 16
+    P = 0.25
+
+    def __init__(self):
+        self.head = _Node(None, self.MAX_LEVEL)
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def _random_level(self):
+        level = 1
+        while level < self.MAX_LEVEL and random.random() < self.P:
+            level += 1
+        return level
+
+    def insert(self, key):
+        update = [None] * self.MAX_LEVEL
+        steps = [0] * self.MAX_LEVEL
+        node, pos = self.head, 0
+        for i in reversed(range(self.MAX_LEVEL)):
+            while node.next[i] is not None and node.next[i].key < key:
+                pos += node.width[i]
+                node = node.next[i]
+            update[i], steps[i] = node, pos
+
+        level = self._random_level()
+        new = _Node(key, level)
+        new_pos = pos + 1
+        for i in range(self.MAX_LEVEL):
+            prev = update[i]
+            if i < level:
+                new.next[i] = prev.next[i]
+                prev.next[i] = new
+                new.width[i] = prev.width[i] - (new_pos - steps[i]) + 1
+                prev.width[i] = new_pos - steps[i]
+            else:
+                prev.width[i] += 1
+        self.size += 1
+
+    def remove(self, key):
+        update = [None] * self.MAX_LEVEL
+        node = self.head
+        for i in reversed(range(self.MAX_LEVEL)):
+            while node.next[i] is not None and node.next[i].key < key:
+                node = node.next[i]
+            update[i] = node
+
+        target = node.next[0]
+        if target is None or target.key != key:
+            return False
+        for i in range(self.MAX_LEVEL):
+            prev = update[i]
+            if prev.next[i] is target:
+                prev.next[i] = target.next[i]
+                prev.width[i] += target.width[i] - 1
+            else:
+                prev.width[i] -= 1
+        self.size -= 1
+        return True
+
+    def rank(self, key):
+        """1-based position of `key`, or None if it isn't present"""
+        node, pos = self.head, 0
+        for i in reversed(range(self.MAX_LEVEL)):
+            while node.next[i] is not None and node.next[i].key <= key:
+                pos += node.width[i]
+                node = node.next[i]
+        return pos if node is not self.head and node.key == key else None
+
+    def slice(self, offset, limit):
+        """Up to `limit` keys starting at 0-based `offset`"""
+        if offset < 0 or offset >= self.size or limit <= 0:
+            return []
+        target = offset + 1
+        node, pos = self.head, 0
+        for i in reversed(range(self.MAX_LEVEL)):
+            while node.next[i] is not None and pos + node.width[i] <= target:
+                pos += node.width[i]
+                node = node.next[i]
+
+        keys = []
+        while node is not None and len(keys) < limit:
+            keys.append(node.key)
+            node = node.next[0]
+        return keys
+
+
+class Leaderboard:
+    """
+    Per-process ranking of active couples by combined_points (ties broken
+    by id). Kept current from Couple saves and point updates, and rebuilt
+    from the DB every LEADERBOARD_RECONCILE_SECONDS to pick up changes made
+    by other processes.
+
+    Only the first load happens inside a request. Later rebuilds run in a
+    background thread, one at a time, while the old ranking keeps serving;
+    updates applied during a rebuild are replayed onto the new ranking.
+    """
+
+    def __init__(self, reconcile_interval=LEADERBOARD_RECONCILE_SECONDS):
+        self.reconcile_interval = reconcile_interval
+        self._lock = threading.RLock()
+        # Held for the whole of a rebuild, so there is only ever one
+        self._rebuild_lock = threading.Lock()
+        self._ranking = RankedSkipList()
+        self._keys = {}
+        self._loaded_at = None
+        # Updates seen while a rebuild is reading the DB
+        self._journal = None
+
+    @staticmethod
+    def _key(couple_id, points):
+        return (-points, couple_id)
+
+    @classmethod
+    def _apply(cls, ranking, keys, couple_id, points, is_active):
+        old = keys.pop(couple_id, None)
+        if old is not None:
+            ranking.remove(old)
+        if is_active:
+            key = cls._key(couple_id, points)
+            ranking.insert(key)
+            keys[couple_id] = key
+
+    def _rebuild(self):
+        with self._lock:
+            self._journal = []
+        try:
+            rows = Couple.objects.filter(is_active=True).values_list('id', 'combined_points')
+            ranking, keys = RankedSkipList(), {}
+            for couple_id, points in rows.iterator(chunk_size=2000):
+                key = self._key(couple_id, points)
+                ranking.insert(key)
+                keys[couple_id] = key
+        except Exception:
+            with self._lock:
+                self._journal = None
+            raise
+
+        with self._lock:
+            # Points are absolute, so replaying an update the rows already include is harmless
+            for update in self._journal:
+                self._apply(ranking, keys, *update)
+            self._journal = None
+            self._ranking, self._keys = ranking, keys
+            self._loaded_at = time.monotonic()
+
+    def reconcile(self):
+        """Rebuild the ranking from the database now"""
+        with self._rebuild_lock:
+            self._rebuild()
+
+    def _reconcile_in_background(self):
+        try:
+            self._rebuild()
+        except Exception:
+            logger.exception("Leaderboard rebuild failed, serving the previous ranking")
+            with self._lock:
+                # Retry after another interval rather than on every request
+                self._loaded_at = time.monotonic()
+        finally:
+            self._rebuild_lock.release()
+            close_old_connections()
+
+    def _ensure_fresh(self):
+        loaded_at = self._loaded_at
+        if loaded_at is None:
+            # Nothing to serve yet, so this one has to wait; concurrent callers share it
+            with self._rebuild_lock:
+                if self._loaded_at is None:
+                    self._rebuild()
+        elif time.monotonic() - loaded_at > self.reconcile_interval:
+            if self._rebuild_lock.acquire(blocking=False):
+                # Released by the thread when the rebuild is done
+                threading.Thread(
+                    target=self._reconcile_in_background,
+                    name='LeaderboardReconcile',
+                    daemon=True
+                ).start()
+
+    def update(self, couple_id, points, is_active=True):
+        """Apply a points change; only journaled until the ranking is first loaded"""
+        with self._lock:
+            if self._journal is not None:
+                self._journal.append((couple_id, points, is_active))
+            if self._loaded_at is None:
+                return
+            self._apply(self._ranking, self._keys, couple_id, points, is_active)
+
+    def remove(self, couple_id):
+        self.update(couple_id, 0, is_active=False)
+
+    def count(self):
+        self._ensure_fresh()
+        return len(self._ranking)
+
+    def rank(self, couple_id):
+        """1-based rank of a couple, or None if it isn't ranked"""
+        self._ensure_fresh()
+        with self._lock:
+            key = self._keys.get(couple_id)
+            return self._ranking.rank(key) if key is not None else None
+
+    def page(self, offset, limit):
+        """[(rank, couple_id, points)] for `limit` couples from `offset`"""
+        self._ensure_fresh()
+        with self._lock:
+            keys = self._ranking.slice(offset, limit)
+        return [
+            (offset + i + 1, couple_id, -points)
+            for i, (points, couple_id) in enumerate(keys)
+        ]
+
+
+ranking = Leaderboard()
+
+
+PERIODS = ('weekly', 'monthly')
+
+
+def record_couple_points(couple_id, points, day=None):
+    """Add awarded points to the couple's daily rollup"""
+    if not points:
+        return
+    increment_or_create(
+        CouplePointsDaily,
+        {'couple_id': couple_id, 'day': day or timezone.localdate()},
+        {'points': points}
+    )
+
+
+def period_start(period, today=None):
+    """First day of the current week (Monday) or month"""
+    today = today or timezone.localdate()
+    if period == 'weekly':
+        return today - timedelta(days=today.weekday())
+    if period == 'monthly':
+        return today.replace(day=1)
+    raise ValueError(f"Unknown leaderboard period: {period}")
+
+
+def period_ranking(period, offset=0, limit=20):
+    """[(rank, couple_id, points)] for the current week or month, from the daily rollups"""
+    rows = (
+        CouplePointsDaily.objects
+        .filter(day__gte=period_start(period), couple__is_active=True)
+        .values('couple_id')
+        .annotate(total=Sum('points'))
+        .order_by('-total', 'couple_id')
+        .values_list('couple_id', 'total')[offset:offset + limit]
+    )
+    return [
+        (offset + i + 1, couple_id, total)
+        for i, (couple_id, total) in enumerate(rows)
+    ]
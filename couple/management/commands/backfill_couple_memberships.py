@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from couple.models import Couple, CoupleMembership
+
+
+class Command(BaseCommand):
+    help = "Create or repair CoupleMembership rows from existing couples"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        # Active couples come last so they win over pending ones for the same user
+        memberships = {}
+        couples = Couple.objects.order_by('is_active', 'created_at', 'id').values_list(
+            'id', 'user1_id', 'user2_id'
+        )
+        for couple_id, user1_id, user2_id in couples.iterator(chunk_size=batch_size):
+            memberships[user1_id] = (couple_id, CoupleMembership.ROLE_USER1)
+            if user2_id:
+                memberships[user2_id] = (couple_id, CoupleMembership.ROLE_USER2)
+
+        rows = [
+            CoupleMembership(user_id=user_id, couple_id=couple_id, role=role)
+            for user_id, (couple_id, role) in memberships.items()
+        ]
+        for start in range(0, len(rows), batch_size):
+            with transaction.atomic():
+                CoupleMembership.objects.bulk_create(
+                    rows[start:start + batch_size],
+                    update_conflicts=True,
+                    unique_fields=['user'],
+                    update_fields=['couple', 'role']
+                )
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Backfilled {len(rows)} couple memberships"
+        ))
@@ -0,0 +1,201 @@
+import asyncio
+import multiprocessing
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+from channels.layers import InMemoryChannelLayer
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.channel_layers import ChannelHub, UnixSocketChannelLayer
+
+GROUP = 'fanout_bench'
+
+
+def make_layer(backend, capacity, address=None):
+    """`address` is the hub socket for unix and the server URL for redis"""
+    if backend == 'unix':
+        return UnixSocketChannelLayer(path=address, capacity=capacity)
+    if backend == 'redis':
+        from channels_redis.core import RedisChannelLayer
+        return RedisChannelLayer(hosts=[address or settings.CHANNEL_REDIS_URL], capacity=capacity)
+    return InMemoryChannelLayer(capacity=capacity)
+
+
+def start_redis_stand_in():
+    """In-process fakeredis server (Lua included) on a free local port; returns (server, url)"""
+    try:
+        from fakeredis import TcpFakeServer
+        import lupa  # noqa: F401, channels_redis runs Lua scripts
+    except ImportError:
+        raise CommandError("--redis-stand-in needs fakeredis with Lua support: pip install 'fakeredis[lua]'")
+    server = TcpFakeServer(('127.0.0.1', 0))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address
+    return server, f'redis://{host}:{port}'
+
+
+async def _receive_all(layer, receivers, messages, ready):
+    channels = [await layer.new_channel() for _ in range(receivers)]
+    for channel in channels:
+        await layer.group_add(GROUP, channel)
+    ready()
+
+    async def drain(channel):
+        latencies = []
+        try:
+            for _ in range(messages):
+                message = await layer.receive(channel)
+                latencies.append(time.time() - message['sent'])
+        except asyncio.CancelledError:
+            pass
+        return latencies
+
+    tasks = [asyncio.ensure_future(drain(channel)) for channel in channels]
+    done, pending = await asyncio.wait(tasks, timeout=max(10, messages / 10))
+    for task in pending:
+        task.cancel()
+    results = await asyncio.gather(*tasks)
+    return [latency for latencies in results for latency in latencies], time.time()
+
+
+def _worker(backend, address, capacity, receivers, messages, ready, results):
+    async def run():
+        layer = make_layer(backend, capacity, address)
+        latencies, finished = await _receive_all(layer, receivers, messages, ready.set)
+        results.put((latencies, finished))
+        if hasattr(layer, 'close'):
+            await layer.close()
+    asyncio.run(run())
+
+
+def _run_hub(socket_path):
+    asyncio.run(ChannelHub(socket_path).serve())
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure group_send fan-out latency and throughput across 1, 4 and 16 "
+        "worker processes for a channel layer backend. With --backend unix a "
+        "private hub is started on a temporary socket; with --backend redis "
+        "--redis-stand-in a local fakeredis server stands in for Redis."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backend', choices=['memory', 'unix', 'redis'], default='unix')
+        parser.add_argument('--workers', default='1,4,16', help="Comma-separated worker counts")
+        parser.add_argument('--sockets', type=int, default=256, help="Receiving channels in total")
+        parser.add_argument('--messages', type=int, default=200, help="group_send calls per run")
+        parser.add_argument(
+            '--redis-stand-in', action='store_true',
+            help="Run the redis backend against a local fakeredis server instead of CHANNEL_REDIS_URL"
+        )
+
+    def handle(self, *args, **options):
+        backend, messages = options['backend'], options['messages']
+        worker_counts = [int(count) for count in options['workers'].split(',')]
+        capacity = messages + 10
+        ctx = multiprocessing.get_context('fork')
+
+        hub = stand_in = address = None
+        if backend == 'unix':
+            address = os.path.join(tempfile.mkdtemp(), 'hub.sock')
+            hub = ctx.Process(target=_run_hub, args=(address,), daemon=True)
+            hub.start()
+            for _ in range(100):
+                if os.path.exists(address):
+                    break
+                time.sleep(0.05)
+            else:
+                raise CommandError("Channel hub did not start")
+        elif backend == 'redis' and options['redis_stand_in']:
+            stand_in, address = start_redis_stand_in()
+            self.stdout.write(f"Using a fakeredis stand-in at {address}")
+
+        try:
+            for workers in worker_counts:
+                if backend == 'memory':
+                    if workers != 1:
+                        self.stdout.write(f"{workers:>3} workers: n/a, the in-memory layer is single-process")
+                        continue
+                    latencies, elapsed = asyncio.run(self._in_process(capacity, options['sockets'], messages))
+                else:
+                    latencies, elapsed = self._multi_process(
+                        ctx, backend, address, capacity, workers, options['sockets'], messages
+                    )
+                self._report(workers, options['sockets'], messages, latencies, elapsed)
+        finally:
+            if hub is not None:
+                hub.terminate()
+                hub.join()
+            if stand_in is not None:
+                stand_in.shutdown()
+                stand_in.server_close()
+
+    async def _in_process(self, capacity, sockets, messages):
+        layer = make_layer('memory', capacity)
+        ready = asyncio.Event()
+        receiving = asyncio.ensure_future(_receive_all(layer, sockets, messages, ready.set))
+        await ready.wait()
+        started = await self._send(layer, messages)
+        latencies, finished = await receiving
+        return latencies, finished - started
+
+    def _multi_process(self, ctx, backend, address, capacity, workers, sockets, messages):
+        results = ctx.Queue()
+        processes = []
+        for i in range(workers):
+            receivers = sockets // workers + (1 if i < sockets % workers else 0)
+            ready = ctx.Event()
+            process = ctx.Process(
+                target=_worker,
+                args=(backend, address, capacity, receivers, messages, ready, results)
+            )
+            process.start()
+            processes.append((process, ready))
+        for _, ready in processes:
+            if not ready.wait(30):
+                raise CommandError("Worker did not join the group in time")
+
+        async def send():
+            layer = make_layer(backend, capacity, address)
+            started = await self._send(layer, messages)
+            if hasattr(layer, 'close'):
+                await layer.close()
+            return started
+
+        started = asyncio.run(send())
+        latencies, finished = [], started
+        for _ in processes:
+            worker_latencies, worker_finished = results.get(timeout=120)
+            latencies.extend(worker_latencies)
+            finished = max(finished, worker_finished)
+        for process, _ in processes:
+            process.join()
+        return latencies, finished - started
+
+    @staticmethod
+    async def _send(layer, messages):
+        started = time.time()
+        for n in range(messages):
+            await layer.group_send(GROUP, {'type': 'bench', 'sent': time.time(), 'n': n})
+            if n % 20 == 19:
+                # Give receivers a chance to keep up, as real traffic would
+                await asyncio.sleep(0.001)
+        return started
+
+    def _report(self, workers, sockets, messages, latencies, elapsed):
+        expected = sockets * messages
+        if not latencies:
+            self.stdout.write(f"{workers:>3} workers: nothing delivered")
+            return
+        latencies.sort()
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        self.stdout.write(
+            f"{workers:>3} workers: {len(latencies)}/{expected} delivered, "
+            f"{len(latencies) / elapsed:,.0f} msg/s, "
+            f"latency p50 {statistics.median(latencies) * 1000:.2f}ms p99 {p99 * 1000:.2f}ms"
+        )
@@ -0,0 +1,78 @@
+import asyncio
+import time
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from couple.messages import MessageBuffer, anext_seq
+from couple.models import Couple, CoupleMessage
+from userProfile.models import CustomUser as User
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare chat message persistence throughput: one INSERT per message "
+        "(the old ChatConsumer path) against the write-behind MessageBuffer. "
+        "Both allocate a sequence number per message, as ChatConsumer does. "
+        "Creates throwaway users and deletes them afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=2000)
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--flush-ms', type=int, default=200)
+
+    def handle(self, *args, **options):
+        count = options['messages']
+        tag = uuid.uuid4().hex[:8]
+        user1 = User.objects.create_user(email=f'chat-bench-{tag}-1@example.com', password=None)
+        user2 = User.objects.create_user(email=f'chat-bench-{tag}-2@example.com', password=None)
+        couple = Couple.objects.create(user1=user1, user2=user2, is_active=True, name='chat bench')
+        try:
+            elapsed = asyncio.run(self._per_message(couple, user1, count))
+            self._report('per-message', count, elapsed)
+
+            buffer = MessageBuffer(options['batch_size'], options['flush_ms'] / 1000)
+            elapsed = asyncio.run(self._buffered(buffer, couple, user1, count))
+            self._report('buffered', count, elapsed)
+
+            written = CoupleMessage.objects.filter(couple=couple).count()
+            self.stdout.write(f"rows written: {written} (expected {count * 2})")
+        finally:
+            User.objects.filter(pk__in=[user1.pk, user2.pk]).delete()
+
+    def _report(self, name, count, elapsed):
+        self.stdout.write(f"{name:>12}: {count} messages in {elapsed:.2f}s ({count / elapsed:.0f} msg/s)")
+
+    @staticmethod
+    def _message(couple, user, i):
+        return CoupleMessage(
+            couple_id=couple.id,
+            sender=user,
+            content=f'benchmark message {i}',
+            client_id=uuid.uuid4().hex,
+            timestamp=timezone.now()
+        )
+
+    async def _per_message(self, couple, user, count):
+        save = sync_to_async(lambda message: message.save())
+        started = time.perf_counter()
+        for i in range(count):
+            await save(self._message(couple, user, i))
+        return time.perf_counter() - started
+
+    async def _buffered(self, buffer, couple, user, count):
+        started = time.perf_counter()
+        for i in range(count):
+            message = self._message(couple, user, i)
+            message.seq = await anext_seq(couple.id)
+            buffer.add(message)
+            # Let scheduled flushes run, as they would between websocket frames
+            await asyncio.sleep(0)
+        await buffer.flush()
+        # Wait for flushes that were already in flight
+        others = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        await asyncio.gather(*others)
+        return time.perf_counter() - started
@@ -0,0 +1,84 @@
+import random
+import statistics
+import time
+import uuid
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from couple.models import Couple, CoupleMessage
+from couple.search import search_messages
+from userProfile.models import CustomUser as User
+
+WORDS = (
+    "love dinner movie tonight tomorrow weekend trip beach coffee work late "
+    "home miss you call later park walk dog cat pizza sushi birthday gift "
+    "flowers sorry thanks morning night sleep dream happy tired busy meeting "
+    "train bus car rain sun cold warm hug kiss laugh song music book game"
+).split()
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark chat search on a seeded couple: content__icontains scans "
+        "against the configured search backend (Postgres GIN or the in-process "
+        "inverted index). Creates throwaway users and deletes them afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=1_000_000)
+        parser.add_argument('--queries', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        tag = uuid.uuid4().hex[:8]
+        user1 = User.objects.create_user(email=f'search-bench-{tag}-1@example.com', password=None)
+        user2 = User.objects.create_user(email=f'search-bench-{tag}-2@example.com', password=None)
+        couple = Couple.objects.create(user1=user1, user2=user2, is_active=True, name='search bench')
+        try:
+            self._seed(couple, [user1, user2], options['messages'], rng)
+            queries = [' '.join(rng.sample(WORDS, rng.choice((1, 2)))) for _ in range(options['queries'])]
+
+            # Ranking needs every match, so the scan can't stop at the first page
+            self._time('icontains', queries, lambda q: list(
+                CoupleMessage.objects.filter(couple=couple, content__icontains=q)
+                .values_list('id', 'content')
+            ))
+            if connection.vendor != 'postgresql':
+                started = time.perf_counter()
+                search_messages(couple.id, WORDS[0])
+                self.stdout.write(f"inverted index build: {time.perf_counter() - started:.2f}s")
+            self._time(f'search ({connection.vendor})', queries, lambda q: search_messages(couple.id, q))
+        finally:
+            User.objects.filter(pk__in=[user1.pk, user2.pk]).delete()
+
+    def _seed(self, couple, users, count, rng):
+        started = time.perf_counter()
+        now = timezone.now()
+        batch = []
+        for i in range(count):
+            batch.append(CoupleMessage(
+                couple=couple,
+                sender=users[i % 2],
+                content=' '.join(rng.choices(WORDS, k=rng.randint(3, 12))),
+                timestamp=now - timedelta(seconds=count - i)
+            ))
+            if len(batch) >= 10000:
+                CoupleMessage.objects.bulk_create(batch)
+                batch = []
+        CoupleMessage.objects.bulk_create(batch)
+        self.stdout.write(f"seeded {count} messages in {time.perf_counter() - started:.1f}s")
+
+    def _time(self, name, queries, run):
+        timings = []
+        for query in queries:
+            started = time.perf_counter()
+            run(query)
+            timings.append((time.perf_counter() - started) * 1000)
+        self.stdout.write(
+            f"{name:>20}: median {statistics.median(timings):.1f}ms "
+            f"max {max(timings):.1f}ms over {len(timings)} queries"
+        )
@@ -0,0 +1,100 @@
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from couple.models import Couple
+from couple.pairing_codes import CODE_MIN, PairingCodeAllocator
+from userProfile.models import CustomUser as User
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark pairing code allocation latency at different code-space "
+        "fill levels, comparing the old random retry loop with the allocator. "
+        "Runs inside a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--space', type=int, default=90000,
+                            help="Size of the simulated code space (production uses 900000)")
+        parser.add_argument('--samples', type=int, default=200)
+        parser.add_argument('--fill', type=int, nargs='+', default=[10, 50, 90],
+                            help="Code-space use percentages to benchmark")
+
+    def handle(self, *args, **options):
+        space = options['space']
+        samples = options['samples']
+
+        self.stdout.write(f"code space={space} samples={samples}")
+        self.stdout.write(f"{'fill':>5} {'strategy':>10} {'mean ms':>9} {'p50 ms':>8} {'p95 ms':>8} {'tries':>6}")
+        for fill in options['fill']:
+            with transaction.atomic():
+                for row in self._run(space, samples, fill):
+                    self.stdout.write("{:>4}% {:>10} {:>9.3f} {:>8.3f} {:>8.3f} {:>6.2f}".format(fill, *row))
+                transaction.set_rollback(True)
+
+    def _run(self, space, samples, fill):
+        allocator = PairingCodeAllocator(settings.SECRET_KEY, space=space, offset=CODE_MIN)
+        user = User.objects.create_user(
+            email=f'pairing-bench-{time.time_ns()}@example.com', password=None
+        )
+        expired = timezone.now() - timedelta(hours=1)
+
+        # Occupy `fill`% of the space with expired codes, as abandoned pairings do
+        held = space * fill // 100
+        Couple.objects.bulk_create(
+            [
+                Couple(user1=user, name='bench', pairing_code=allocator.code_for(n),
+                       pairing_code_expires=expired)
+                for n in range(1, held + 1)
+            ],
+            batch_size=5000
+        )
+
+        legacy = self._time_legacy(self._new_couples(user, samples), space)
+        current = self._time_allocator(self._new_couples(user, samples), allocator, space)
+        return [legacy, current]
+
+    @staticmethod
+    def _new_couples(user, count):
+        return Couple.objects.bulk_create(
+            [Couple(user1=user, name='bench') for _ in range(count)]
+        )
+
+    def _time_legacy(self, couples, space):
+        timings, tries = [], []
+        for couple in couples:
+            attempts = 0
+            start = time.perf_counter()
+            while True:
+                attempts += 1
+                code = str(random.randint(CODE_MIN, CODE_MIN + space - 1))
+                if not Couple.objects.filter(pairing_code=code).exists():
+                    break
+            couple.pairing_code = code
+            couple.save(update_fields=['pairing_code'])
+            timings.append(time.perf_counter() - start)
+            tries.append(attempts)
+        return self._summary('random', timings, statistics.mean(tries))
+
+    def _time_allocator(self, couples, allocator, space):
+        timings = []
+        # Counters past the end of the space wrap onto the expired holders
+        for counter, couple in enumerate(couples, start=space + 1):
+            start = time.perf_counter()
+            couple.pairing_code = allocator.allocate(counter, exclude_pk=couple.pk)
+            couple.save(update_fields=['pairing_code'])
+            timings.append(time.perf_counter() - start)
+        return self._summary('allocator', timings, 1)
+
+    @staticmethod
+    def _summary(name, timings, tries):
+        timings = sorted(t * 1000 for t in timings)
+        p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+        return name, statistics.mean(timings), statistics.median(timings), p95, tries
@@ -0,0 +1,74 @@
+import asyncio
+import time
+import uuid
+
+from channels.db import database_sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework_simplejwt.tokens import AccessToken
+
+from core.middleware import JWTAuthMiddleware, ws_identity_cache
+from core.routing import websocket_urlpatterns
+from couple.models import Couple
+from userProfile.models import CustomUser as User
+
+
+class LookupPerConnectMiddleware(JWTAuthMiddleware):
+    """Baseline: same token check, but the user and couple are loaded on every connect"""
+
+    async def resolve(self, raw_token):
+        ws_identity_cache.clear()
+        return await super().resolve(raw_token)
+
+
+class Command(BaseCommand):
+    help = (
+        "Reconnect storm against the WebSocket stack: many clients connecting "
+        "to /ws/couple/ with a JWT at once, with and without the cached "
+        "identity lookup. Creates throwaway users and deletes them afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--couples', type=int, default=50)
+        parser.add_argument('--connects', type=int, default=2000)
+        parser.add_argument('--concurrency', type=int, default=100)
+
+    def handle(self, *args, **options):
+        tag = uuid.uuid4().hex[:8]
+        users = []
+        for i in range(options['couples']):
+            user1 = User.objects.create_user(email=f'ws-bench-{tag}-{i}-1@example.com', password=None)
+            user2 = User.objects.create_user(email=f'ws-bench-{tag}-{i}-2@example.com', password=None)
+            Couple.objects.create(user1=user1, user2=user2, is_active=True, name='ws bench')
+            users += [user1, user2]
+        tokens = [str(AccessToken.for_user(user)) for user in users]
+
+        try:
+            for name, middleware in (('per-connect lookup', LookupPerConnectMiddleware), ('cached identity', JWTAuthMiddleware)):
+                ws_identity_cache.clear()
+                application = middleware(URLRouter(websocket_urlpatterns))
+                connected, elapsed = asyncio.run(
+                    self._storm(application, tokens, options['connects'], options['concurrency'])
+                )
+                if connected != options['connects']:
+                    raise CommandError(f"{name}: only {connected}/{options['connects']} connects accepted")
+                self.stdout.write(f"{name:>18}: {connected / elapsed:,.0f} connects/s ({connected} in {elapsed:.2f}s)")
+        finally:
+            User.objects.filter(pk__in=[user.pk for user in users]).delete()
+
+    async def _storm(self, application, tokens, connects, concurrency):
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def connect(i):
+            async with semaphore:
+                communicator = WebsocketCommunicator(application, f'/ws/couple/?token={tokens[i % len(tokens)]}')
+                accepted, _ = await communicator.connect()
+                await communicator.disconnect()
+                return accepted
+
+        # Warm the DB connection of the sync worker thread
+        await database_sync_to_async(User.objects.exists)()
+        started = time.perf_counter()
+        results = await asyncio.gather(*(connect(i) for i in range(connects)))
+        return sum(1 for accepted in results if accepted), time.perf_counter() - started
@@ -0,0 +1,46 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from couple.models import PairingAttempt
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete raw PairingAttempt rows past the retention period in bounded "
+        "batches. Hourly per-IP counts stay in PairingAttemptSummary."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.PAIRING_ATTEMPT_RETENTION_DAYS)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--sleep', type=float, default=0,
+                            help="Seconds to pause between batches to go easy on the DB")
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        batch_size = options['batch_size']
+        started = time.monotonic()
+        deleted = batches = 0
+
+        while True:
+            ids = list(
+                PairingAttempt.objects.filter(attempted_at__lt=cutoff)
+                .order_by('attempted_at')
+                .values_list('id', flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+            count, _ = PairingAttempt.objects.filter(id__in=ids).delete()
+            deleted += count
+            batches += 1
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Pruned {deleted} pairing attempts older than {cutoff:%Y-%m-%d %H:%M} "
+            f"in {batches} batches ({time.monotonic() - started:.2f}s)"
+        ))
@@ -0,0 +1,72 @@
+from collections import defaultdict
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F, Sum
+from django.db.models.functions import TruncDate
+
+from couple.models import CouplePointsDaily
+from reward.models import CoupleAchievement
+from task.models import Task
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild CouplePointsDaily from completed tasks and unlocked "
+        "achievements, for backfills or after a rollup bug."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help="Only rebuild days from this date (YYYY-MM-DD)")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                since = date.fromisoformat(options['since'])
+            except ValueError:
+                raise CommandError("--since must be a YYYY-MM-DD date")
+
+        totals = defaultdict(int)
+
+        tasks = Task.objects.filter(is_completed=True, completed_at__isnull=False)
+        if since:
+            tasks = tasks.filter(completed_at__date__gte=since)
+        rows = (
+            tasks.annotate(day=TruncDate('completed_at'))
+            .values('couple_id', 'day')
+            .annotate(points=Sum('points'))
+            .order_by()
+        )
+        for row in rows.iterator():
+            totals[(row['couple_id'], row['day'])] += row['points']
+
+        # Achievements award their XP to both partners
+        unlocks = CoupleAchievement.objects.all()
+        if since:
+            unlocks = unlocks.filter(unlocked_at__date__gte=since)
+        rows = (
+            unlocks.annotate(day=TruncDate('unlocked_at'))
+            .values('couple_id', 'day')
+            .annotate(points=Sum(F('achievement__xp_reward') * 2))
+            .order_by()
+        )
+        for row in rows.iterator():
+            totals[(row['couple_id'], row['day'])] += row['points']
+
+        rollups = [
+            CouplePointsDaily(couple_id=couple_id, day=day, points=points)
+            for (couple_id, day), points in totals.items()
+        ]
+        with transaction.atomic():
+            stale = CouplePointsDaily.objects.all()
+            if since:
+                stale = stale.filter(day__gte=since)
+            deleted, _ = stale.delete()
+            CouplePointsDaily.objects.bulk_create(rollups, batch_size=options['batch_size'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Replaced {deleted} daily rollups with {len(rollups)} rebuilt ones"
+        ))
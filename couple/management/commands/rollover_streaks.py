@@ -0,0 +1,34 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from couple.models import Couple
+from userProfile.models import UserProfile
+
+
+class Command(BaseCommand):
+    help = (
+        "Nightly streak rollover: reset the streak of every couple and user "
+        "with no activity since the day before yesterday, one UPDATE each."
+    )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        yesterday = timezone.localdate() - timedelta(days=1)
+
+        couples = Couple.objects.filter(
+            last_activity_date__lt=yesterday,
+            current_streak__gt=0
+        ).update(current_streak=0)
+
+        profiles = UserProfile.objects.filter(
+            last_activity_date__lt=yesterday,
+            streak__gt=0
+        ).update(streak=0)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Reset {couples} couple streaks and {profiles} user streaks "
+            f"({time.monotonic() - started:.2f}s)"
+        ))
@@ -0,0 +1,23 @@
+import asyncio
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.channel_layers import ChannelHub
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the channel hub that UnixSocketChannelLayer workers on this host "
+        "connect to (CHANNEL_LAYER_BACKEND=unix). Start it before the ASGI workers."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--socket', default=settings.CHANNEL_HUB_SOCKET)
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Channel hub listening on {options['socket']}")
+        try:
+            asyncio.run(ChannelHub(options['socket']).serve())
+        except KeyboardInterrupt:
+            pass
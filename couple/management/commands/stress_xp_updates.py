@@ -0,0 +1,108 @@
+import threading
+import time
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from django.test.utils import CaptureQueriesContext
+
+from couple.models import Couple
+from couple.points import award_xp
+from userProfile.models import CustomUser as User, UserProfile
+
+
+class Command(BaseCommand):
+    help = (
+        "Concurrency stress check for XP awards: several threads award XP to "
+        "the same couple at once and the totals must add up exactly. Runs the "
+        "old read-modify-write path for comparison. Creates throwaway users "
+        "and deletes them afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--awards', type=int, default=50, help="Awards per thread")
+        parser.add_argument('--points', type=int, default=10)
+
+    def handle(self, *args, **options):
+        threads, awards, points = options['threads'], options['awards'], options['points']
+        expected = threads * awards * points
+
+        user1, user2, couple = self._setup()
+        try:
+            for name, award in (('legacy', self._legacy_award), ('award_xp', self._award)):
+                self._reset(couple)
+                errors = []
+                started = time.perf_counter()
+                workers = [
+                    threading.Thread(
+                        target=self._worker,
+                        args=(award, [user1, user2][i % 2], couple, awards, points, errors)
+                    )
+                    for i in range(threads)
+                ]
+                for worker in workers:
+                    worker.start()
+                for worker in workers:
+                    worker.join()
+                elapsed = time.perf_counter() - started
+
+                couple.refresh_from_db()
+                xp = sum(UserProfile.objects.filter(user__in=[user1, user2]).values_list('xp', flat=True))
+                lost = expected - couple.combined_points
+                self.stdout.write(
+                    f"{name:>9}: xp={xp} combined_points={couple.combined_points} "
+                    f"expected={expected} lost={lost} errors={len(errors)} "
+                    f"queries/award={self._queries_per_award(award, user1, couple)} "
+                    f"({elapsed:.2f}s)"
+                )
+                if name == 'award_xp' and (lost or xp != expected or errors):
+                    raise CommandError(f"award_xp lost updates: {errors[:3]}")
+        finally:
+            User.objects.filter(pk__in=[user1.pk, user2.pk]).delete()
+
+        self.stdout.write(self.style.SUCCESS("No lost updates with award_xp"))
+
+    def _setup(self):
+        tag = uuid.uuid4().hex[:8]
+        user1 = User.objects.create_user(email=f'xp-stress-{tag}-1@example.com', password=None)
+        user2 = User.objects.create_user(email=f'xp-stress-{tag}-2@example.com', password=None)
+        couple = Couple.objects.create(user1=user1, user2=user2, is_active=True, name='xp stress')
+        return user1, user2, couple
+
+    @staticmethod
+    def _reset(couple):
+        UserProfile.objects.filter(user__in=[couple.user1_id, couple.user2_id]).update(xp=0, level=1)
+        Couple.objects.filter(pk=couple.pk).update(combined_points=0)
+
+    @staticmethod
+    def _worker(award, user, couple, awards, points, errors):
+        try:
+            for _ in range(awards):
+                try:
+                    with transaction.atomic():
+                        award(user, couple, points)
+                except Exception as e:
+                    errors.append(e)
+        finally:
+            connections.close_all()
+
+    @staticmethod
+    def _award(user, couple, points):
+        award_xp([user.id], points, couple_id=couple.id)
+
+    @staticmethod
+    def _legacy_award(user, couple, points):
+        # What complete_task used to do
+        profile = UserProfile.objects.get(user_id=user.id)
+        profile.xp += points
+        profile.save()
+        couple = Couple.objects.get(pk=couple.pk)
+        couple.combined_points = couple.user1.userprofile.xp + couple.user2.userprofile.xp
+        couple.save()
+
+    @staticmethod
+    def _queries_per_award(award, user, couple):
+        with CaptureQueriesContext(connection) as queries:
+            award(user, couple, 1)
+        return len(queries)
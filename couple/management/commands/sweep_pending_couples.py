@@ -0,0 +1,74 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from couple.models import Couple
+
+
+class Command(BaseCommand):
+    help = (
+        "Clear expired pairing codes and delete abandoned pending couples in "
+        "bounded batches. Safe to run while traffic is live: every batch "
+        "re-checks expiry, so a code that is still valid is never touched."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stale-hours', type=int, default=settings.PENDING_COUPLE_STALE_HOURS,
+                            help="Delete never-paired couples created more than this many hours ago")
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--sleep', type=float, default=0,
+                            help="Seconds to pause between batches")
+
+    def handle(self, *args, **options):
+        self.batch_size = options['batch_size']
+        self.sleep = options['sleep']
+        now = timezone.now()
+
+        started = time.monotonic()
+        cleared, batches = self._run_batches(
+            Couple.objects.filter(
+                is_active=False,
+                pairing_code__isnull=False,
+                pairing_code_expires__lte=now
+            ),
+            lambda qs: qs.update(pairing_code=None, pairing_code_expires=None)
+        )
+        self.stdout.write(
+            f"Cleared {cleared} expired pairing codes in {batches} batches "
+            f"({time.monotonic() - started:.2f}s)"
+        )
+
+        started = time.monotonic()
+        deleted, batches = self._run_batches(
+            Couple.objects.filter(
+                is_active=False,
+                user2__isnull=True,
+                pairing_code__isnull=True,
+                created_at__lt=now - timedelta(hours=options['stale_hours'])
+            ),
+            lambda qs: qs.delete()[1].get(Couple._meta.label, 0)
+        )
+        self.stdout.write(
+            f"Deleted {deleted} stale pending couples in {batches} batches "
+            f"({time.monotonic() - started:.2f}s)"
+        )
+
+        self.stdout.write(self.style.SUCCESS("Sweep complete"))
+
+    def _run_batches(self, queryset, apply):
+        """Apply `apply` to `queryset` one id batch at a time; returns (rows, batches)"""
+        total = batches = 0
+        while True:
+            ids = list(queryset.order_by('id').values_list('id', flat=True)[:self.batch_size])
+            if not ids:
+                return total, batches
+            with transaction.atomic():
+                # Re-apply the filter so rows changed since the id scan are skipped
+                total += apply(queryset.filter(id__in=ids))
+            batches += 1
+            if self.sleep:
+                time.sleep(self.sleep)
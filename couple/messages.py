@@ -0,0 +1,384 @@
+import asyncio
+import atexit
+import base64
+import logging
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from core.batching import TRANSIENT_ERRORS
+from core.metrics import registry
+from .archive import archived_page
+from .models import Couple, CoupleMessage, CoupleMessageArchive, CoupleMessageCounter, CoupleReadState
+
+logger = logging.getLogger(__name__)
+
+HISTORY_PAGE_SIZE = 50
+
+CHAT_DEDUPE_SECONDS = getattr(settings, 'CHAT_DEDUPE_SECONDS', 3600)
+
+dead_letters = registry.counter('chat_buffer_dead_letters_total', "Buffered chat messages that could not be written")
+overflow_drops = registry.counter('chat_buffer_dropped_total', "Buffered chat messages dropped because the buffer was full")
+
+
+def persist_messages(messages):
+    """
+    Write a batch of unsaved CoupleMessage instances and bump unread
+    counters. Messages whose client id is already stored (resends) are
+    skipped and not counted again.
+    """
+    messages = _unsent(messages)
+    with transaction.atomic():
+        created = CoupleMessage.objects.bulk_create(messages, batch_size=500)
+        count_unread(created)
+    return created
+
+
+def _unsent(messages):
+    batch, seen = [], set()
+    for message in messages:
+        key = (message.couple_id, message.client_id)
+        if message.client_id is None or key not in seen:
+            seen.add(key)
+            batch.append(message)
+
+    client_ids = {message.client_id for message in batch if message.client_id is not None}
+    if not client_ids:
+        return batch
+    stored = set(
+        CoupleMessage.objects.filter(
+            couple_id__in={message.couple_id for message in batch}, client_id__in=client_ids
+        ).values_list('couple_id', 'client_id')
+    )
+    # A concurrent writer can still get in between; the unique constraint
+    # then fails the batch and MessageBuffer._write sets the resend aside
+    return [message for message in batch if (message.couple_id, message.client_id) not in stored]
+
+
+def _already_stored(message):
+    return message.client_id is not None and CoupleMessage.objects.filter(
+        couple_id=message.couple_id, client_id=message.client_id
+    ).exists()
+
+
+def count_unread(messages):
+    """
+    Add newly written messages to each recipient's unread counter: one
+    UPDATE per (couple, sender) in the batch. Messages older than the
+    recipient's read pointer (read live before they were written) are
+    not counted.
+    """
+    groups = {}
+    for message in messages:
+        key = (message.couple_id, message.sender_id)
+        count, newest = groups.get(key, (0, message.timestamp))
+        groups[key] = (count + 1, max(newest, message.timestamp))
+    if not groups:
+        return
+
+    members = Couple.objects.filter(id__in={couple_id for couple_id, _ in groups}).values_list('id', 'user1_id', 'user2_id')
+    members = {couple_id: (user1_id, user2_id) for couple_id, user1_id, user2_id in members}
+    for (couple_id, sender_id), (count, newest) in groups.items():
+        for user_id in members.get(couple_id, ()):
+            if user_id and user_id != sender_id:
+                _add_unread(couple_id, user_id, count, newest)
+
+
+def _add_unread(couple_id, user_id, count, newest):
+    rows = CoupleReadState.objects.filter(couple_id=couple_id, user_id=user_id)
+    behind = Q(last_read_at__isnull=True) | Q(last_read_at__lt=newest)
+    if rows.filter(behind).update(unread_count=F('unread_count') + count):
+        return
+    # Either there is no row yet, or the pointer is already past these messages
+    CoupleReadState.objects.get_or_create(
+        couple_id=couple_id, user_id=user_id,
+        defaults={'unread_count': count}
+    )
+
+
+def mark_read(couple_id, user_id):
+    """Move the user's read pointer to now and clear their unread counter"""
+    now = timezone.now()
+    CoupleReadState.objects.update_or_create(
+        couple_id=couple_id, user_id=user_id,
+        defaults={'unread_count': 0, 'last_read_at': now}
+    )
+    return now
+
+
+def read_marks(couple_id):
+    """{user_id: last_read_at} for a couple's members"""
+    return dict(
+        CoupleReadState.objects.filter(couple_id=couple_id).values_list('user_id', 'last_read_at')
+    )
+
+
+class MessageBuffer:
+    """
+    Write-behind buffer for chat messages. Consumers broadcast first and
+    hand the message over here; it is written with bulk_create once
+    `batch_size` messages are waiting or `flush_interval` seconds after the
+    first one arrived. Anything left at shutdown is flushed synchronously.
+
+    A batch that fails is split and retried in halves, so a bad message
+    (say a NUL byte, or a couple deleted meanwhile) is set aside on its own
+    instead of holding back the rest. Connection errors retry the whole
+    batch; while the database stays away, at most `max_pending` messages
+    are kept and the oldest are dropped.
+    """
+
+    def __init__(self, batch_size=50, flush_interval=0.2, max_pending=10000):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending = []
+        self._timer = None
+        self._flushes = set()
+        atexit.register(self.flush_sync)
+
+    def __len__(self):
+        return len(self._pending)
+
+    def add(self, message):
+        """Queue a message; never waits on the database"""
+        self._pending.append(message)
+        self._trim()
+        if len(self._pending) >= self.batch_size:
+            self._schedule(0)
+        elif self._timer is None:
+            self._schedule(self.flush_interval)
+
+    def _schedule(self, delay):
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = asyncio.get_running_loop().call_later(delay, self._start_flush)
+
+    def _start_flush(self):
+        # Referenced until done so the task can't be garbage collected midway
+        task = asyncio.get_running_loop().create_task(self.flush())
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    def _take(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        return batch
+
+    def _trim(self):
+        overflow = len(self._pending) - self.max_pending
+        if overflow > 0:
+            del self._pending[:overflow]
+            overflow_drops.inc(overflow)
+            logger.error("Chat message buffer full, dropped the %d oldest messages", overflow)
+
+    def _write(self, batch):
+        """
+        persist_messages, bisecting around messages that fail on their own.
+        Returns the messages that could not be written; transient errors
+        are raised for the caller to retry.
+        """
+        try:
+            persist_messages(batch)
+            return []
+        except TRANSIENT_ERRORS:
+            raise
+        except Exception:
+            if len(batch) == 1:
+                message = batch[0]
+                if _already_stored(message):
+                    logger.info("Chat message %s (couple %s) was already stored", message.client_id, message.couple_id)
+                    return []
+                logger.exception(
+                    "Dropping chat message %s (couple %s, sender %s) that cannot be written",
+                    message.client_id, message.couple_id, message.sender_id
+                )
+                dead_letters.inc()
+                return batch
+        middle = len(batch) // 2
+        return self._write(batch[:middle]) + self._write(batch[middle:])
+
+    async def flush(self):
+        batch = self._take()
+        if not batch:
+            return 0
+        try:
+            failed = await database_sync_to_async(self._write)(batch)
+        except Exception:
+            logger.exception("Failed to persist %d chat messages, will retry", len(batch))
+            self._pending[:0] = batch
+            self._trim()
+            self._schedule(self.flush_interval)
+            return 0
+        return len(batch) - len(failed)
+
+    def flush_sync(self):
+        """Flush from synchronous code, e.g. at interpreter exit"""
+        batch = self._take()
+        if not batch:
+            return 0
+        try:
+            failed = self._write(batch)
+        except Exception:
+            logger.exception("Lost %d buffered chat messages", len(batch))
+            return 0
+        return len(batch) - len(failed)
+
+
+message_buffer = MessageBuffer(
+    batch_size=settings.CHAT_BUFFER_BATCH_SIZE,
+    flush_interval=settings.CHAT_BUFFER_FLUSH_MS / 1000,
+    max_pending=settings.CHAT_BUFFER_MAX_PENDING
+)
+
+
+def next_seq(couple_id):
+    """
+    Allocate the couple's next message sequence number with one UPDATE ...
+    RETURNING on its CoupleMessageCounter row (created on first use).
+    Numbers are unique and increasing across every worker, and survive
+    restarts. Outside a transaction the row lock lasts only the statement.
+
+    Reserving blocks per worker would save the round trip, but numbers
+    from different workers would then interleave out of order and leave
+    holes that chat sync has to wait out as missing messages.
+    """
+    quote = connection.ops.quote_name
+    table = quote(CoupleMessageCounter._meta.db_table)
+    couple_col = quote(CoupleMessageCounter._meta.get_field('couple').column)
+    last_seq = quote(CoupleMessageCounter._meta.get_field('last_seq').column)
+    sql = f'UPDATE {table} SET {last_seq} = {last_seq} + 1 WHERE {couple_col} = %s RETURNING {last_seq}'
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [couple_id])
+        row = cursor.fetchone()
+        if row:
+            return row[0]
+        try:
+            with transaction.atomic():
+                CoupleMessageCounter.objects.create(couple_id=couple_id, last_seq=1)
+            return 1
+        except IntegrityError:
+            # Another worker created it first, unless the couple is gone
+            cursor.execute(sql, [couple_id])
+            row = cursor.fetchone()
+            if row is None:
+                raise
+            return row[0]
+
+
+async def anext_seq(couple_id):
+    return await database_sync_to_async(next_seq)(couple_id)
+
+
+def current_seq(couple_id):
+    """Last sequence number handed out for a couple, written yet or not"""
+    return CoupleMessageCounter.objects.filter(couple_id=couple_id).values_list('last_seq', flat=True).first() or 0
+
+
+def _client_key(couple_id, client_id):
+    return f'chat:client:{couple_id}:{client_id}'
+
+
+async def claim_client_id(couple_id, client_id):
+    """
+    Reserve a client-supplied message id. Returns None the first time and
+    the original sequence number (0 while it is still being assigned) when
+    the same id is sent again within CHAT_DEDUPE_SECONDS. The keys live in
+    the 'chat' cache, away from everything else; settings insist on it
+    being shared once there are several workers.
+    """
+    key = _client_key(couple_id, client_id)
+    if await caches['chat'].aadd(key, 0, timeout=CHAT_DEDUPE_SECONDS):
+        return None
+    return await caches['chat'].aget(key, 0)
+
+
+async def record_client_seq(couple_id, client_id, seq):
+    await caches['chat'].aset(_client_key(couple_id, client_id), seq, timeout=CHAT_DEDUPE_SECONDS)
+
+
+def messages_since(couple_id, last_seq, limit):
+    """Up to `limit` live messages numbered after `last_seq`, oldest first"""
+    return list(
+        CoupleMessage.objects.filter(couple_id=couple_id, seq__gt=last_seq)
+        .select_related('sender')
+        .order_by('seq')[:limit]
+    )
+
+
+def sync_needs_reload(couple_id, last_seq, limit):
+    """
+    True when a client at `last_seq` is missing more than `limit` messages,
+    or messages that have since been archived, and should reload history
+    instead of replaying the gap.
+    """
+    if CoupleMessageArchive.objects.filter(couple_id=couple_id, last_seq__gt=last_seq).exists():
+        return True
+    return CoupleMessage.objects.filter(couple_id=couple_id, seq__gt=last_seq).order_by('seq')[limit:limit + 1].exists()
+
+
+def encode_cursor(message):
+    """Opaque history cursor for a message's (timestamp, id) position"""
+    raw = f'{message.timestamp.isoformat()}|{message.id}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """(timestamp, id) from a cursor; raises ValueError if it is malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        timestamp, message_id = raw.rsplit('|', 1)
+        timestamp, message_id = parse_datetime(timestamp), int(message_id)
+    except (TypeError, ValueError, UnicodeDecodeError):
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+    if timestamp is None:
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+    return timestamp, message_id
+
+
+def _live_page(couple_id, before=None, after=None, limit=HISTORY_PAGE_SIZE):
+    messages = CoupleMessage.objects.filter(couple_id=couple_id).select_related('sender')
+    if after is not None:
+        timestamp, message_id = after
+        newer = messages.filter(
+            Q(timestamp__gt=timestamp) | Q(timestamp=timestamp, id__gt=message_id)
+        ).order_by('timestamp', 'id')[:limit]
+        return list(newer)[::-1]
+    if before is not None:
+        timestamp, message_id = before
+        messages = messages.filter(
+            Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=message_id)
+        )
+    return list(messages.order_by('-timestamp', '-id')[:limit])
+
+
+def message_page(couple_id, before=None, after=None, limit=HISTORY_PAGE_SIZE):
+    """
+    Up to `limit` messages, newest first, older than the `before` cursor or
+    newer than the `after` cursor (the latest messages if neither is given).
+    Each page is a range scan on couple_message_history_idx, so it costs the
+    same however far back it is. Pages that reach past the live table carry
+    on into the archived monthly blocks.
+    """
+    before = decode_cursor(before) if before else None
+    after = decode_cursor(after) if after else None
+
+    if after is not None:
+        # Only blocks ending at or after the cursor are read, whatever age archive_messages used
+        archived = archived_page(couple_id, after=after, limit=limit)
+        if len(archived) >= limit:
+            return archived
+        return _live_page(couple_id, after=after, limit=limit - len(archived)) + archived
+
+    messages = _live_page(couple_id, before=before, limit=limit)
+    if len(messages) < limit:
+        if messages:
+            before = (messages[-1].timestamp, messages[-1].id)
+        messages += archived_page(couple_id, before=before, limit=limit - len(messages))
+    return messages
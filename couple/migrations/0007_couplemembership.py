@@ -0,0 +1,49 @@
+# Generated by Django 5.2.3 on 2026-10-18 07:49
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_memberships(apps, schema_editor):
+    """Same as the backfill_couple_memberships command, so existing couples stay visible"""
+    Couple = apps.get_model('couple', 'Couple')
+    CoupleMembership = apps.get_model('couple', 'CoupleMembership')
+
+    # Active couples come last so they win over pending ones for the same user
+    memberships = {}
+    couples = Couple.objects.order_by('is_active', 'created_at', 'id').values_list('id', 'user1_id', 'user2_id')
+    for couple_id, user1_id, user2_id in couples.iterator(chunk_size=1000):
+        memberships[user1_id] = (couple_id, 'USER1')
+        if user2_id:
+            memberships[user2_id] = (couple_id, 'USER2')
+
+    CoupleMembership.objects.bulk_create(
+        [
+            CoupleMembership(user_id=user_id, couple_id=couple_id, role=role)
+            for user_id, (couple_id, role) in memberships.items()
+        ],
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('couple', '0006_couplemessage'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CoupleMembership',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('role', models.CharField(choices=[('USER1', 'User 1'), ('USER2', 'User 2')], max_length=5)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('couple', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='memberships', to='couple.couple')),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='couple_membership', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.RunPython(backfill_memberships, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.3 on 2026-10-18 07:52
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('couple', '0007_couplemembership'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='pairingattempt',
+            name='attempted_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
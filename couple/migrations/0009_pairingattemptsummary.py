@@ -0,0 +1,61 @@
+# Generated by Django 5.2.3 on 2026-10-18 07:53
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q
+from django.db.models.functions import TruncHour
+
+
+def backfill_summaries(apps, schema_editor):
+    PairingAttempt = apps.get_model('couple', 'PairingAttempt')
+    PairingAttemptSummary = apps.get_model('couple', 'PairingAttemptSummary')
+
+    rows = (
+        PairingAttempt.objects
+        .annotate(hour=TruncHour('attempted_at'))
+        .values('ip_address', 'hour')
+        .annotate(attempts=Count('id'), failures=Count('id', filter=Q(was_successful=False)))
+        .order_by()
+    )
+    PairingAttemptSummary.objects.bulk_create(
+        [PairingAttemptSummary(**row) for row in rows.iterator()],
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('couple', '0008_alter_pairingattempt_attempted_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PairingAttemptSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ip_address', models.GenericIPAddressField()),
+                ('hour', models.DateTimeField()),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('failures', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='pairingattempt',
+            index=models.Index(fields=['ip_address', 'was_successful', 'attempted_at'], name='pairing_attempt_ip_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pairingattempt',
+            index=models.Index(fields=['attempted_at'], name='pairing_attempt_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pairingattemptsummary',
+            index=models.Index(fields=['hour'], name='pairing_summary_hour_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='pairingattemptsummary',
+            constraint=models.UniqueConstraint(fields=('ip_address', 'hour'), name='unique_pairing_summary_hour'),
+        ),
+        migrations.RunPython(backfill_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.3 on 2026-10-18 07:56
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('couple', '0009_pairingattemptsummary'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='couple',
+            index=models.Index(fields=['is_active', '-combined_points', 'id'], name='couple_leaderboard_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.3 on 2026-10-18 07:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('couple', '0010_couple_leaderboard_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CouplePointsDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('points', models.IntegerField(default=0)),
+                ('couple', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_points', to='couple.couple')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['day', 'couple', 'points'], name='couple_points_day_idx')],
+                'constraints': [models.UniqueConstraint(fields=('couple', 'day'), name='unique_couple_points_day')],
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.3 on 2026-10-18 08:00
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('couple', '0011_couplepointsdaily'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='couplemessage',
+            name='client_id',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AlterField(
+            model_name='couplemessage',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
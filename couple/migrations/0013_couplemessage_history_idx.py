@@ -0,0 +1,19 @@
+# Generated by Django 5.2.3 on 2026-10-18 08:02
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('couple', '0012_couplemessage_client_id'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='couplemessage',
+            index=models.Index(fields=['couple', '-timestamp', '-id'], name='couple_message_history_idx'),
+        ),
+    ]
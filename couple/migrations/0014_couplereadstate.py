@@ -0,0 +1,29 @@
+# Generated by Django 5.2.3 on 2026-10-18 08:03
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('couple', '0013_couplemessage_history_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CoupleReadState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('unread_count', models.PositiveIntegerField(default=0)),
+                ('last_read_at', models.DateTimeField(blank=True, null=True)),
+                ('couple', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='read_states', to='couple.couple')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='couple_read_states', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('couple', 'user'), name='unique_couple_read_state')],
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.3 on 2026-10-18 08:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('couple', '0014_couplereadstate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CoupleMessageArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('first_timestamp', models.DateTimeField()),
+                ('last_timestamp', models.DateTimeField()),
+                ('message_count', models.PositiveIntegerField(default=0)),
+                ('data', models.BinaryField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('couple', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='message_archives', to='couple.couple')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('couple', 'month'), name='unique_couple_message_archive')],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+from django.db import migrations
+
+# Must match the expression SearchVector('content', config='english') compiles to
+SEARCH_INDEX_SQL = (
+    "CREATE INDEX IF NOT EXISTS couple_message_search_idx ON couple_couplemessage "
+    "USING gin (to_tsvector('english'::regconfig, COALESCE(content, '')))"
+)
+
+
+def create_search_index(apps, schema_editor):
+    # Other backends search through the in-process index in couple/search.py
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(SEARCH_INDEX_SQL)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute("DROP INDEX IF EXISTS couple_message_search_idx")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('couple', '0015_couplemessagearchive'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.2.3 on 2026-10-18 08:16
+
+from django.db import migrations, models
+
+
+def number_messages(apps, schema_editor):
+    """
+    Give existing messages sequence numbers in history order. Archived
+    messages count first, so numbering carries on after them; duplicate
+    client ids are cleared so the unique constraint can be added.
+    """
+    CoupleMessage = apps.get_model('couple', 'CoupleMessage')
+    CoupleMessageArchive = apps.get_model('couple', 'CoupleMessageArchive')
+
+    couple_ids = set(CoupleMessage.objects.values_list('couple_id', flat=True).distinct())
+    couple_ids |= set(CoupleMessageArchive.objects.values_list('couple_id', flat=True).distinct())
+    for couple_id in couple_ids:
+        seq = 0
+        for block in CoupleMessageArchive.objects.filter(couple_id=couple_id).order_by('month'):
+            seq += block.message_count
+            block.last_seq = seq
+            block.save(update_fields=['last_seq'])
+
+        seen, batch = set(), []
+        messages = CoupleMessage.objects.filter(couple_id=couple_id).order_by('timestamp', 'id')
+        for message in messages.iterator(chunk_size=2000):
+            seq += 1
+            message.seq = seq
+            if message.client_id is not None:
+                if message.client_id in seen:
+                    message.client_id = None
+                seen.add(message.client_id)
+            batch.append(message)
+        CoupleMessage.objects.bulk_update(batch, ['seq', 'client_id'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('couple', '0016_couplemessage_search_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='couplemessage',
+            name='seq',
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='couplemessagearchive',
+            name='last_seq',
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(number_messages, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='couplemessage',
+            index=models.Index(fields=['couple', 'seq'], name='couple_message_seq_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='couplemessage',
+            constraint=models.UniqueConstraint(fields=('couple', 'client_id'), name='unique_couple_message_client_id'),
+        ),
+    ]
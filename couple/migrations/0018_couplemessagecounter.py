@@ -0,0 +1,63 @@
+# Generated by Django 5.2.3 on 2026-10-18 08:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def create_counters(apps, schema_editor):
+    """
+    Start each couple's counter after its highest number, live or archived.
+    Cache-allocated numbers could repeat across workers, so repeated and
+    missing ones are renumbered past the end first.
+    """
+    CoupleMessage = apps.get_model('couple', 'CoupleMessage')
+    CoupleMessageArchive = apps.get_model('couple', 'CoupleMessageArchive')
+    CoupleMessageCounter = apps.get_model('couple', 'CoupleMessageCounter')
+
+    archived = dict(
+        CoupleMessageArchive.objects.values('couple_id').annotate(seq=Max('last_seq')).values_list('couple_id', 'seq')
+    )
+    live = dict(
+        CoupleMessage.objects.values('couple_id').annotate(seq=Max('seq')).values_list('couple_id', 'seq')
+    )
+    counters = []
+    for couple_id in set(archived) | set(live):
+        last_seq = max(archived.get(couple_id) or 0, live.get(couple_id) or 0)
+        seen, renumbered = set(), []
+        messages = CoupleMessage.objects.filter(couple_id=couple_id).order_by('timestamp', 'id').only('id', 'seq')
+        for message in messages.iterator(chunk_size=2000):
+            if message.seq is None or message.seq in seen:
+                last_seq += 1
+                message.seq = last_seq
+                renumbered.append(message)
+            seen.add(message.seq)
+        CoupleMessage.objects.bulk_update(renumbered, ['seq'], batch_size=1000)
+        counters.append(CoupleMessageCounter(couple_id=couple_id, last_seq=last_seq))
+    CoupleMessageCounter.objects.bulk_create(counters, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('couple', '0017_couplemessage_seq'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CoupleMessageCounter',
+            fields=[
+                ('couple', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='message_counter', serialize=False, to='couple.couple')),
+                ('last_seq', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(create_counters, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='couplemessage',
+            name='couple_message_seq_idx',
+        ),
+        migrations.AddConstraint(
+            model_name='couplemessage',
+            constraint=models.UniqueConstraint(fields=('couple', 'seq'), name='unique_couple_message_seq'),
+        ),
+    ]
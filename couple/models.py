@@ -1,7 +1,6 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
 from django.contrib.auth import get_user_model
 from userProfile.models import CustomUser as User
-import random
 from django.utils import timezone
 from datetime import timedelta
 from django.conf import settings
@@ -32,6 +31,10 @@ class Couple(models.Model):
                 condition=models.Q(user2__isnull=False)
             )
         ]
+        indexes = [
+            # Leaderboard keyset scans: WHERE is_active ORDER BY combined_points DESC, id
+            models.Index(fields=['is_active', '-combined_points', 'id'], name='couple_leaderboard_idx'),
+        ]
 
     def clean(self):
         # Prevent self-pairing
@@ -40,13 +43,10 @@ class Couple(models.Model):
         
         # Check if users are already in a couple
         if self.is_active:
-            existing = Couple.objects.filter(
-                models.Q(user1=self.user1) | 
-                models.Q(user2=self.user1) |
-                models.Q(user1=self.user2) | 
-                models.Q(user2=self.user2),
-                is_active=True
-            ).exclude(id=self.id)
+            existing = CoupleMembership.objects.filter(
+                user_id__in=[self.user1_id, self.user2_id],
+                couple__is_active=True
+            ).exclude(couple_id=self.id)
             if existing.exists():
                 raise ValueError("One or both users are already in a couple.")
     
@@ -72,17 +72,33 @@ class Couple(models.Model):
         self.pairing_code = None
         self.pairing_code_expires = None
         self.save()
+        self.sync_memberships()
+
+        from .couple import invalidate_user_couple
+        invalidate_user_couple(self.user1, self.user2)
 
     
     def generate_pairing_code(self):
-        """Generate a unique pairing code."""
-        while True:
-            code = str(random.randint(100000, 999999))
-            if not Couple.objects.filter(pairing_code=code).exists():
-                self.pairing_code = code
-                self.pairing_code_expires = timezone.now() + timedelta(minutes=15)
-                self.save()
+        """
+        Generate a unique pairing code derived from the couple id. Retried up
+        to 3 times if a concurrent allocation takes the same code.
+        """
+        from .pairing_codes import pairing_code_allocator
+
+        if self.pk is None:
+            self.save()
+        for attempt in range(3):
+            code = pairing_code_allocator.allocate(self.pk, exclude_pk=self.pk)
+            self.pairing_code = code
+            self.pairing_code_expires = timezone.now() + timedelta(minutes=15)
+            try:
+                with transaction.atomic():
+                    self.save()
                 return code
+            except IntegrityError:
+                # Taken by a concurrent allocation; the next pass walks past it
+                if attempt == 2:
+                    raise
     
     def is_code_valid(self):
         """Check if code is still valid"""
@@ -93,23 +109,41 @@ class Couple(models.Model):
         )
 
     def update_streak(self):
-        today = timezone.now().date()
-        if self.last_activity_date == today - timedelta(days=1):
+        """
+        Count today's activity towards the streak. Only the first activity of
+        a day writes and notifies; broken streaks are reset by the nightly
+        rollover_streaks job.
+        """
+        today = timezone.localdate()
+        previous_date = self.last_activity_date
+        if previous_date == today and self.current_streak:
+            return self.current_streak
+
+        if previous_date == today - timedelta(days=1):
             self.current_streak += 1
-            if self.current_streak > self.longest_streak:
-                self.longest_streak = self.current_streak
-        elif self.last_activity_date != today:
+        elif previous_date != today or not self.current_streak:
             self.current_streak = 1
-        
+        self.longest_streak = max(self.longest_streak, self.current_streak)
         self.last_activity_date = today
-        self.save()
+
+        # Conditional on the date we read, so concurrent completions roll the day over once
+        updated = Couple.objects.filter(
+            pk=self.pk,
+            last_activity_date=previous_date
+        ).update(
+            current_streak=self.current_streak,
+            longest_streak=self.longest_streak,
+            last_activity_date=today,
+            updated_at=timezone.now()
+        )
+        if not updated:
+            self.refresh_from_db(fields=['current_streak', 'longest_streak', 'last_activity_date'])
+            return self.current_streak
         
         # Notify clients
-        from channels.layers import get_channel_layer
-        from asgiref.sync import async_to_sync
+        from .broadcast import broadcast
         
-        channel_layer = get_channel_layer()
-        async_to_sync(channel_layer.group_send)(
+        broadcast(
             f'couple_{self.id}',
             {
                 'type': 'couple_update',
@@ -117,11 +151,38 @@ class Couple(models.Model):
                     'type': 'streak_updated',
                     'payload': self.current_streak
                 }
-            }
+            },
+            coalesce='streak_updated'
         )
         
         return self.current_streak
 
+    def sync_memberships(self):
+        """
+        Point both users' CoupleMembership rows at this couple.
+        A pending couple never takes a user away from their active couple.
+        """
+        members = [(self.user1_id, CoupleMembership.ROLE_USER1)]
+        if self.user2_id:
+            members.append((self.user2_id, CoupleMembership.ROLE_USER2))
+
+        for user_id, role in members:
+            if self.is_active:
+                CoupleMembership.objects.update_or_create(
+                    user_id=user_id,
+                    defaults={'couple': self, 'role': role}
+                )
+                continue
+
+            membership, created = CoupleMembership.objects.select_related('couple').get_or_create(
+                user_id=user_id,
+                defaults={'couple': self, 'role': role}
+            )
+            if not created and membership.couple_id != self.id and not membership.couple.is_active:
+                membership.couple = self
+                membership.role = role
+                membership.save(update_fields=['couple', 'role'])
+
     def get_streak_bonus(self):
         if self.current_streak >= 7:
             return 0.5  # 50% bonus after 7 days
@@ -138,6 +199,46 @@ class Couple(models.Model):
         return [self.user1, self.user2]
     
 
+class CouplePointsDaily(models.Model):
+    """Points a couple earned on one day, for weekly/monthly leaderboards"""
+    couple = models.ForeignKey(Couple, on_delete=models.CASCADE, related_name='daily_points')
+    day = models.DateField()
+    points = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['couple', 'day'], name='unique_couple_points_day')
+        ]
+        indexes = [
+            # Covers the "sum points per couple since day X" leaderboard scan
+            models.Index(fields=['day', 'couple', 'points'], name='couple_points_day_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.couple} earned {self.points} on {self.day}"
+
+
+class CoupleMembership(models.Model):
+    """
+    Denormalized user -> couple link, one row per user.
+    Lets membership checks use a unique index instead of OR-ing user1/user2.
+    """
+    ROLE_USER1 = 'USER1'
+    ROLE_USER2 = 'USER2'
+    ROLE_CHOICES = [
+        (ROLE_USER1, 'User 1'),
+        (ROLE_USER2, 'User 2'),
+    ]
+
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='couple_membership')
+    couple = models.ForeignKey(Couple, on_delete=models.CASCADE, related_name='memberships')
+    role = models.CharField(max_length=5, choices=ROLE_CHOICES)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.user} in {self.couple} ({self.role})"
+
+
 class PairingAttempt(models.Model):
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -147,23 +248,114 @@ class PairingAttempt(models.Model):
     )
     ip_address = models.GenericIPAddressField()
     code_attempt = models.CharField(max_length=6)
-    attempted_at = models.DateTimeField(auto_now_add=True)
+    attempted_at = models.DateTimeField(default=timezone.now)
     was_successful = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['ip_address', 'was_successful', 'attempted_at'], name='pairing_attempt_ip_idx'),
+            models.Index(fields=['attempted_at'], name='pairing_attempt_time_idx'),
+        ]
+
+
+class PairingAttemptSummary(models.Model):
+    """Hourly per-IP rollup of PairingAttempt, kept after raw rows are pruned"""
+    ip_address = models.GenericIPAddressField()
+    hour = models.DateTimeField()
+    attempts = models.PositiveIntegerField(default=0)
+    failures = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['ip_address', 'hour'], name='unique_pairing_summary_hour')
+        ]
+        indexes = [
+            models.Index(fields=['hour'], name='pairing_summary_hour_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.ip_address} @ {self.hour:%Y-%m-%d %H}:00: {self.failures}/{self.attempts} failed"
+
 
 class CoupleMessage(models.Model):
     couple = models.ForeignKey(Couple, on_delete= models.CASCADE, related_name='messages')
     sender = models.ForeignKey(User, on_delete=models.CASCADE)
     content = models.TextField()
-    timestamp = models.DateTimeField(auto_now_add=True)
+    timestamp = models.DateTimeField(default=timezone.now)
+    # Superseded by CoupleReadState; no longer updated
     is_read = models.BooleanField(default=False)
+    # Id handed out at broadcast time, before the row is written
+    client_id = models.CharField(max_length=64, null=True, blank=True)
+    # Per-couple position, increasing in send order; clients resume sync from it
+    seq = models.PositiveBigIntegerField(null=True, blank=True)
 
     class Meta:
         ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['couple', '-timestamp', '-id'], name='couple_message_history_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['couple', 'seq'], name='unique_couple_message_seq'),
+            # A resent message (same client id) is written only once
+            models.UniqueConstraint(fields=['couple', 'client_id'], name='unique_couple_message_client_id'),
+        ]
 
     def __str__(self):
         return f'Message from {self.sender.username} to {self.couple}'
 
     def mark_as_read(self):
         self.is_read = True
-        self.save()
\ No newline at end of file
+        self.save()
+
+
+class CoupleMessageCounter(models.Model):
+    """Last message sequence number handed out for a couple (see messages.next_seq)"""
+    couple = models.OneToOneField(Couple, on_delete=models.CASCADE, primary_key=True, related_name='message_counter')
+    last_seq = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.couple} at message {self.last_seq}"
+
+
+class CoupleMessageArchive(models.Model):
+    """
+    One couple's chat messages for one month, moved out of CoupleMessage by
+    archive_messages and stored as a zlib-compressed msgpack list
+    (see couple/archive.py). History reads these blocks transparently.
+    """
+    couple = models.ForeignKey(Couple, on_delete=models.CASCADE, related_name='message_archives')
+    month = models.DateField()
+    first_timestamp = models.DateTimeField()
+    last_timestamp = models.DateTimeField()
+    message_count = models.PositiveIntegerField(default=0)
+    last_seq = models.PositiveBigIntegerField(null=True, blank=True)
+    data = models.BinaryField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['couple', 'month'], name='unique_couple_message_archive')
+        ]
+
+    def __str__(self):
+        return f"{self.message_count} messages of {self.couple} from {self.month:%Y-%m}"
+
+
+class CoupleReadState(models.Model):
+    """
+    Per (couple, user) read pointer and unread counter for the couple chat.
+    The counter grows as partner messages are written and is reset by moving
+    the pointer, so neither unread badges nor mark-as-read scan messages.
+    """
+    couple = models.ForeignKey(Couple, on_delete=models.CASCADE, related_name='read_states')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='couple_read_states')
+    unread_count = models.PositiveIntegerField(default=0)
+    last_read_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['couple', 'user'], name='unique_couple_read_state')
+        ]
+
+    def __str__(self):
+        return f"{self.user} has {self.unread_count} unread in {self.couple}"
\ No newline at end of file
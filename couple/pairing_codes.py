@@ -0,0 +1,95 @@
+import hashlib
+import math
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+# Six digit codes: 100000 - 999999
+CODE_MIN = 100000
+CODE_SPACE = 900000
+
+# Codes tried past a still-valid holder before giving up
+MAX_WALK = 16
+
+
+class PairingCodesExhausted(ValueError):
+    """No free code was found within MAX_WALK steps"""
+
+
+class PairingCodeAllocator:
+    """
+    Maps a counter (the couple id) onto the pairing code space with a keyed
+    permutation, so every counter gets its own code without probing the DB.
+
+    The permutation is a small Feistel network over a radix x radix grid with
+    cycle walking to stay inside the code space. Codes repeat every `space`
+    counters; by then the previous holder's code has long expired and is
+    reclaimed in place. A code still validly held (e.g. a legacy random
+    code) is skipped by walking on to the next code in the permutation.
+    """
+    ROUNDS = 4
+
+    def __init__(self, key, space=CODE_SPACE, offset=CODE_MIN):
+        if isinstance(key, str):
+            key = key.encode()
+        self.space = space
+        self.offset = offset
+        self.radix = math.isqrt(space - 1) + 1
+        self._round_keys = [
+            hashlib.blake2b(key, digest_size=32, person=f'pcode-r{i}'.encode()).digest()
+            for i in range(self.ROUNDS)
+        ]
+
+    def _round(self, i, value):
+        digest = hashlib.blake2b(
+            value.to_bytes(4, 'big'), key=self._round_keys[i], digest_size=4
+        ).digest()
+        return int.from_bytes(digest, 'big') % self.radix
+
+    def _encrypt(self, value):
+        left, right = divmod(value, self.radix)
+        for i in range(self.ROUNDS):
+            left, right = right, (left + self._round(i, right)) % self.radix
+        return left * self.radix + right
+
+    def _walk(self, value):
+        value = self._encrypt(value)
+        # Cycle walk until we land back inside the code space
+        while value >= self.space:
+            value = self._encrypt(value)
+        return value
+
+    def code_for(self, counter):
+        """Return the pairing code for a counter value"""
+        return str(self.offset + self._walk(counter % self.space))
+
+    def next_code(self, code):
+        """The code after `code` in the permutation cycle"""
+        return str(self.offset + self._walk(int(code) - self.offset))
+
+    def allocate(self, counter, exclude_pk=None):
+        """
+        Return a free code for `counter`: its own code, reclaimed from an
+        expired holder if need be, or the next free one along the cycle.
+        """
+        from .models import Couple
+
+        code = self.code_for(counter)
+        for _ in range(MAX_WALK):
+            holders = Couple.objects.filter(pairing_code=code).exclude(pk=exclude_pk)
+            holders.filter(
+                Q(pairing_code_expires__lte=timezone.now()) | Q(pairing_code_expires__isnull=True)
+            ).update(
+                pairing_code=None,
+                pairing_code_expires=None
+            )
+            if not holders.exists():
+                return code
+            code = self.next_code(code)
+        raise PairingCodesExhausted(f"No free pairing code within {MAX_WALK} steps of counter {counter}")
+
+
+pairing_code_allocator = PairingCodeAllocator(
+    getattr(settings, 'PAIRING_CODE_KEY', settings.SECRET_KEY)
+)
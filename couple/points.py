@@ -0,0 +1,85 @@
+from django.db import connection
+
+from userProfile.models import UserProfile
+from .leaderboard import ranking, record_couple_points
+from .models import Couple
+
+# Mirrors calculate_level() in task/views.py: int((xp / 100) ** 0.6) + 1
+_LEVEL_SQL = "CASE WHEN {xp} > 0 THEN FLOOR(POWER(({xp}) / 100.0, 0.6)) + 1 ELSE 1 END"
+
+
+def _quoted(model, *names):
+    quote = connection.ops.quote_name
+    return [quote(model._meta.db_table)] + [quote(model._meta.get_field(name).column) for name in names]
+
+
+def _update_profiles(user_ids, delta, minimum=None):
+    """
+    Add `delta` XP to the given users' profiles and recompute their level in
+    one UPDATE ... RETURNING. With `minimum`, only profiles that still have
+    at least that much XP are touched. Returns {user_id: (xp, level)}.
+    """
+    table, user_col, xp, level = _quoted(UserProfile, 'user', 'xp', 'level')
+    placeholders = ', '.join(['%s'] * len(user_ids))
+    new_xp = f'{xp} + %s'
+    sql = (
+        f'UPDATE {table} SET {xp} = {new_xp}, {level} = {_LEVEL_SQL.format(xp=new_xp)} '
+        f'WHERE {user_col} IN ({placeholders})'
+    )
+    params = [delta, delta, delta, *user_ids]
+    if minimum is not None:
+        sql += f' AND {xp} >= %s'
+        params.append(minimum)
+    sql += f' RETURNING {user_col}, {xp}, {level}'
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return {user_id: (new, lvl) for user_id, new, lvl in cursor.fetchall()}
+
+
+def _update_couple_points(couple_id, delta):
+    table, pk, points, active = _quoted(Couple, 'id', 'combined_points', 'is_active')
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'UPDATE {table} SET {points} = {points} + %s WHERE {pk} = %s '
+            f'RETURNING {points}, {active}',
+            [delta, couple_id]
+        )
+        row = cursor.fetchone()
+    if row:
+        ranking.update(couple_id, row[0], bool(row[1]))
+    return row[0] if row else None
+
+
+def award_xp(user_ids, amount, couple_id=None):
+    """
+    Give `amount` XP to each user and add the total to the couple's
+    combined_points, its daily rollup and the in-process leaderboard.
+    Every change is a relative UPDATE, so concurrent awards never lose
+    points and no row locks are taken.
+    Returns {user_id: (xp, level)}.
+    """
+    user_ids = [user_id for user_id in user_ids if user_id]
+    if not user_ids or not amount:
+        return {}
+
+    profiles = _update_profiles(user_ids, amount)
+    if couple_id and profiles:
+        total = amount * len(profiles)
+        _update_couple_points(couple_id, total)
+        record_couple_points(couple_id, total)
+    return profiles
+
+
+def spend_xp(user_id, amount, couple_id=None):
+    """
+    Take `amount` XP from a user if they have enough, keeping the couple's
+    combined_points in step. The balance check is part of the UPDATE, so no
+    lock is needed. Returns (xp, level), or None if the balance was too low.
+    """
+    profiles = _update_profiles([user_id], -amount, minimum=amount)
+    if not profiles:
+        return None
+    if couple_id:
+        _update_couple_points(couple_id, -amount)
+    return profiles[user_id]
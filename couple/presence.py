@@ -0,0 +1,127 @@
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+
+PRESENCE_TTL = getattr(settings, 'PRESENCE_TTL', 60)
+TYPING_DEBOUNCE_SECONDS = getattr(settings, 'TYPING_DEBOUNCE_SECONDS', 3)
+TYPING_TIMEOUT_SECONDS = getattr(settings, 'TYPING_TIMEOUT_SECONDS', 6)
+
+
+def _isoformat(timestamp):
+    return datetime.fromtimestamp(timestamp, tz=dt_timezone.utc).isoformat() if timestamp else None
+
+
+class PresenceStore:
+    """
+    Who is online in each couple, kept in process memory only. Local
+    connections stay online for `ttl` seconds after their last heartbeat;
+    state for members connected to other workers is learned from presence
+    events on the couple group and expires the same way, so a member who
+    stays online is re-announced every ttl / 2 (see announce_due).
+    """
+
+    def __init__(self, ttl=PRESENCE_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # (couple_id, user_id) -> {channel_name: expires_at}
+        self._connections = {}
+        # (couple_id, user_id) -> expires_at, for members on other workers
+        self._remote = {}
+        # (couple_id, user_id) -> last time we heard from them
+        self._last_seen = {}
+        # (couple_id, user_id) -> when we last told other workers they are online
+        self._announced = {}
+
+    def _live(self, key, now):
+        channels = self._connections.get(key)
+        if channels:
+            for channel in [c for c, expires_at in channels.items() if expires_at < now]:
+                del channels[channel]
+            if not channels:
+                del self._connections[key]
+        if self._remote.get(key, now) < now:
+            del self._remote[key]
+        return bool(self._connections.get(key)) or key in self._remote
+
+    def touch(self, couple_id, user_id, channel):
+        """Record a connect or heartbeat; True if the user just came online"""
+        key, now = (couple_id, user_id), time.time()
+        with self._lock:
+            was_online = self._live(key, now)
+            self._connections.setdefault(key, {})[channel] = now + self.ttl
+            self._last_seen[key] = now
+        return not was_online
+
+    def leave(self, couple_id, user_id, channel):
+        """Record a disconnect; True if the user has no connections left here"""
+        key, now = (couple_id, user_id), time.time()
+        with self._lock:
+            channels = self._connections.get(key, {})
+            channels.pop(channel, None)
+            self._last_seen[key] = now
+            if not channels:
+                self._connections.pop(key, None)
+                self._remote.pop(key, None)
+                self._announced.pop(key, None)
+            return not self._live(key, now)
+
+    def announced(self, couple_id, user_id):
+        """Record that a local user's online state was just broadcast"""
+        with self._lock:
+            self._announced[(couple_id, user_id)] = time.time()
+
+    def announce_due(self, couple_id, user_id):
+        """True if a local user was last announced online over ttl / 2 ago"""
+        with self._lock:
+            return time.time() - self._announced.get((couple_id, user_id), 0) >= self.ttl / 2
+
+    def observe(self, couple_id, user_id, online, last_seen=None):
+        """Apply a presence event from another worker"""
+        key, now = (couple_id, user_id), time.time()
+        with self._lock:
+            if online:
+                self._remote[key] = now + self.ttl
+            else:
+                self._remote.pop(key, None)
+            self._last_seen[key] = max(self._last_seen.get(key, 0), last_seen or now)
+
+    def state(self, couple_id, user_id):
+        """(online, last_seen timestamp or None)"""
+        key = (couple_id, user_id)
+        with self._lock:
+            return self._live(key, time.time()), self._last_seen.get(key)
+
+    def members(self, couple_id):
+        """[(user_id, online, last_seen)] for every member this worker knows about"""
+        now = time.time()
+        with self._lock:
+            user_ids = {user_id for (cid, user_id) in self._last_seen if cid == couple_id}
+            return [
+                (user_id, self._live((couple_id, user_id), now), self._last_seen[(couple_id, user_id)])
+                for user_id in user_ids
+            ]
+
+
+presence = PresenceStore()
+
+
+def presence_event(user_id, online, last_seen):
+    return {
+        'type': 'couple_update',
+        'payload': {
+            'type': 'presence',
+            'payload': {'user_id': user_id, 'online': online, 'last_seen': _isoformat(last_seen)},
+        },
+    }
+
+
+def typing_event(user_id, typing):
+    return {
+        'type': 'couple_update',
+        'payload': {
+            'type': 'typing',
+            'payload': {'user_id': user_id, 'typing': typing},
+        },
+    }
@@ -0,0 +1,174 @@
+import base64
+import math
+import re
+import threading
+from collections import Counter, OrderedDict
+
+from django.db import connection
+from django.db.models import Q
+
+from .models import CoupleMessage
+
+SEARCH_PAGE_SIZE = 20
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(text):
+    return [token for token in _TOKEN_RE.findall(text.lower()) if len(token) > 1]
+
+
+def encode_search_cursor(score, message_id):
+    """Opaque cursor for a (score, id) position in ranked search results"""
+    raw = f'{score!r}|{message_id}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_search_cursor(cursor):
+    """(score, id) from a search cursor; raises ValueError if it is malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        score, message_id = raw.rsplit('|', 1)
+        return float(score), int(message_id)
+    except (TypeError, ValueError, UnicodeDecodeError):
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+
+
+class _CoupleIndex:
+    __slots__ = ('postings', 'size', 'last_id', 'removed')
+
+    def __init__(self):
+        # token -> {message_id: term frequency}
+        self.postings = {}
+        self.size = 0
+        self.last_id = 0
+        self.removed = set()
+
+    def add(self, message_id, content):
+        for token, count in Counter(tokenize(content)).items():
+            self.postings.setdefault(token, {})[message_id] = count
+        self.size += 1
+        self.last_id = max(self.last_id, message_id)
+
+
+class InvertedIndex:
+    """
+    In-process search index used when the database has no full-text
+    support (SQLite in development). Postings are built per couple on first
+    search, kept for the `max_couples` most recently searched couples, and
+    caught up with one `id > last_id` query before every search, so
+    messages written by other processes are found too.
+    """
+
+    def __init__(self, max_couples=64):
+        self.max_couples = max_couples
+        self._couples = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _catch_up(self, couple_id):
+        index = self._couples.pop(couple_id, None) or _CoupleIndex()
+        self._couples[couple_id] = index
+        while len(self._couples) > self.max_couples:
+            self._couples.popitem(last=False)
+
+        rows = (
+            CoupleMessage.objects.filter(couple_id=couple_id, id__gt=index.last_id)
+            .order_by('id')
+            .values_list('id', 'content')
+        )
+        for message_id, content in rows.iterator(chunk_size=5000):
+            index.add(message_id, content)
+        return index
+
+    def search(self, couple_id, query, after=None, limit=SEARCH_PAGE_SIZE):
+        """
+        [(score, message_id)] for messages containing every query term,
+        best first (ties newest first), after the (score, id) position
+        `after`. Scores are summed tf-idf.
+        """
+        tokens = set(tokenize(query))
+        if not tokens:
+            return []
+
+        with self._lock:
+            index = self._catch_up(couple_id)
+            postings = [index.postings.get(token) for token in tokens]
+            if not all(postings):
+                return []
+            postings.sort(key=len)
+            idf = [math.log(1 + index.size / len(posting)) for posting in postings]
+
+            hits = []
+            for message_id, count in postings[0].items():
+                if message_id in index.removed:
+                    continue
+                score = count * idf[0]
+                for posting, weight in zip(postings[1:], idf[1:]):
+                    other = posting.get(message_id)
+                    if other is None:
+                        break
+                    score += other * weight
+                else:
+                    hits.append((round(score, 6), message_id))
+
+        if after is not None:
+            hits = [hit for hit in hits if hit < after]
+        hits.sort(reverse=True)
+        return hits[:limit]
+
+    def discard(self, couple_id, message_ids):
+        """Forget messages that have been deleted or archived"""
+        with self._lock:
+            index = self._couples.get(couple_id)
+            if index is not None:
+                index.removed.update(message_ids)
+
+
+inverted_index = InvertedIndex()
+
+
+def _postgres_search(couple_id, query, after, limit):
+    from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+
+    # Same expression as couple_message_search_idx
+    vector = SearchVector('content', config='english')
+    search_query = SearchQuery(query, config='english')
+    messages = (
+        CoupleMessage.objects.filter(couple_id=couple_id)
+        .annotate(document=vector)
+        .filter(document=search_query)
+        .annotate(score=SearchRank(vector, search_query))
+        .select_related('sender')
+    )
+    if after is not None:
+        score, message_id = after
+        messages = messages.filter(Q(score__lt=score) | Q(score=score, id__lt=message_id))
+    messages = list(messages.order_by('-score', '-id')[:limit])
+    return [(message.score, message) for message in messages]
+
+
+def _fallback_search(couple_id, query, after, limit):
+    hits = inverted_index.search(couple_id, query, after=after, limit=limit)
+    found = CoupleMessage.objects.select_related('sender').in_bulk([message_id for _, message_id in hits])
+    missing = [message_id for _, message_id in hits if message_id not in found]
+    if missing:
+        inverted_index.discard(couple_id, missing)
+    return [(score, found[message_id]) for score, message_id in hits if message_id in found]
+
+
+def search_messages(couple_id, query, cursor=None, limit=SEARCH_PAGE_SIZE):
+    """
+    Ranked full-text search over a couple's live (not archived) messages.
+    Returns ([(score, message)], next_cursor); next_cursor is None on the
+    last page. Uses the Postgres GIN index when available and the
+    in-process inverted index otherwise.
+    """
+    after = decode_search_cursor(cursor) if cursor else None
+    search = _postgres_search if connection.vendor == 'postgresql' else _fallback_search
+    results = search(couple_id, query, after, limit)
+
+    next_cursor = None
+    if len(results) == limit:
+        score, message = results[-1]
+        next_cursor = encode_search_cursor(score, message.id)
+    return results, next_cursor
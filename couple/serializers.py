@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from .models import Couple, CoupleMessage
+from .messages import encode_cursor
 from userProfile.serializers import UserSerializer
 
 class CoupleSerializer(serializers.ModelSerializer):
@@ -23,15 +24,54 @@ class CoupleSerializer(serializers.ModelSerializer):
 class CoupleLeaderboardSerializer(serializers.ModelSerializer):
     user1_name = serializers.CharField(source='user1.username')
     user2_name = serializers.CharField(source='user2.username', allow_null=True)
+    rank = serializers.SerializerMethodField()
     
     class Meta:
         model = Couple
-        fields = ['name', 'user1_name', 'user2_name', 'combined_points']
+        fields = ['id', 'rank', 'name', 'user1_name', 'user2_name', 'combined_points']
+
+    def get_rank(self, obj):
+        """Rank comes from the leaderboard, passed in as context={'ranks': {id: rank}}"""
+        return self.context.get('ranks', {}).get(obj.id)
+
+class CouplePeriodLeaderboardSerializer(CoupleLeaderboardSerializer):
+    period_points = serializers.SerializerMethodField()
+
+    class Meta(CoupleLeaderboardSerializer.Meta):
+        fields = CoupleLeaderboardSerializer.Meta.fields + ['period_points']
+
+    def get_period_points(self, obj):
+        return self.context.get('points', {}).get(obj.id, 0)
 
 class CoupleMessageSerializer(serializers.ModelSerializer):
     sender_username = serializers.CharField(source='sender.username', read_only=True)
+    cursor = serializers.SerializerMethodField()
     
     class Meta:
         model = CoupleMessage
-        fields = ['id', 'content', 'sender', 'sender_username', 'timestamp', 'is_read']
-        read_only_fields = ['sender', 'timestamp', 'is_read']
\ No newline at end of file
+        fields = ['id', 'content', 'sender', 'sender_username', 'timestamp', 'is_read', 'seq', 'cursor']
+        read_only_fields = ['sender', 'timestamp', 'is_read', 'seq']
+
+    def get_cursor(self, obj):
+        return encode_cursor(obj)
+
+    def to_representation(self, obj):
+        data = super().to_representation(obj)
+        marks = self.context.get('read_marks')
+        if marks is not None:
+            # Read once any other member's pointer has passed it
+            data['is_read'] = any(
+                last_read_at is not None and last_read_at >= obj.timestamp
+                for user_id, last_read_at in marks.items()
+                if user_id != obj.sender_id
+            )
+        return data
+
+class CoupleMessageSearchSerializer(CoupleMessageSerializer):
+    rank = serializers.SerializerMethodField()
+
+    class Meta(CoupleMessageSerializer.Meta):
+        fields = CoupleMessageSerializer.Meta.fields + ['rank']
+
+    def get_rank(self, obj):
+        return self.context.get('scores', {}).get(obj.id)
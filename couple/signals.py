@@ -0,0 +1,52 @@
+from django.db.models.signals import post_save, post_delete, pre_save
+from django.dispatch import receiver
+from .models import Couple, CoupleMessage
+from .couple import invalidate_user_couple
+from .leaderboard import ranking
+from .messages import count_unread, next_seq
+
+
+@receiver(post_save, sender=Couple)
+def create_couple_membership(sender, instance, created, **kwargs):
+    # Later changes go through Couple.activate_pairing
+    if created:
+        instance.sync_memberships()
+
+
+@receiver(post_save, sender=Couple)
+def invalidate_couple_cache_on_deactivate(sender, instance, created, **kwargs):
+    # Activation is handled by Couple.activate_pairing
+    if not created and not instance.is_active:
+        invalidate_user_couple(instance.user1_id, instance.user2_id)
+
+
+@receiver(post_delete, sender=Couple)
+def invalidate_couple_cache_on_delete(sender, instance, **kwargs):
+    invalidate_user_couple(instance.user1_id, instance.user2_id)
+
+
+@receiver(post_save, sender=Couple)
+def update_leaderboard(sender, instance, update_fields=None, **kwargs):
+    # Partial saves that don't touch the ranking (e.g. streaks) may hold stale points
+    if update_fields is not None and not {'combined_points', 'is_active'} & set(update_fields):
+        return
+    ranking.update(instance.id, instance.combined_points, instance.is_active)
+
+
+@receiver(post_delete, sender=Couple)
+def remove_from_leaderboard(sender, instance, **kwargs):
+    ranking.remove(instance.id)
+
+
+@receiver(pre_save, sender=CoupleMessage)
+def number_message(sender, instance, raw=False, **kwargs):
+    # Chat sockets number their messages before broadcasting; this covers single saves
+    if instance.seq is None and not raw:
+        instance.seq = next_seq(instance.couple_id)
+
+
+@receiver(post_save, sender=CoupleMessage)
+def count_unread_message(sender, instance, created, **kwargs):
+    # Buffered chat messages are counted in persist_messages
+    if created:
+        count_unread([instance])
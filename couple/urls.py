@@ -1,5 +1,5 @@
 from django.urls import path
-from .views import CoupleDetailView, initiate_pairing, check_pairing_status, confirm_pairing, leaderboard, CoupleView, get_message_history, mark_messages_as_read
+from .views import CoupleDetailView, initiate_pairing, check_pairing_status, confirm_pairing, leaderboard, leaderboard_around_me, period_leaderboard, CoupleView, get_message_history, mark_messages_as_read, search_message_history, unread_message_count
 
 urlpatterns = [
     path('', CoupleView.as_view(), name="couple-list"),
@@ -9,7 +9,11 @@ urlpatterns = [
     path('pairing/status/', check_pairing_status, name='pairing-status'),
 
     path('leaderboard/', leaderboard, name='couple-leaderboard'),
+    path('leaderboard/around-me/', leaderboard_around_me, name='couple-leaderboard-around-me'),
+    path('leaderboard/<str:period>/', period_leaderboard, name='couple-period-leaderboard'),
 
     path('messages/', get_message_history, name='message-history'),
+    path('messages/search/', search_message_history, name='message-search'),
     path('messages/read/', mark_messages_as_read, name='mark-messages-read'),
+    path('messages/unread/', unread_message_count, name='unread-message-count'),
 ]
\ No newline at end of file
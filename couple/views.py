@@ -1,10 +1,16 @@
-from django.db import models
+from django.conf import settings
 from django.utils import timezone
+from django.utils.cache import get_conditional_response
 from django.db import transaction
 from django.db.models import Q
-from .models import Couple, PairingAttempt, CoupleMessage
-from .serializers import CoupleSerializer, CoupleLeaderboardSerializer, CoupleMessageSerializer
-from .couple import get_user_couple
+from .models import Couple, CoupleReadState
+from .serializers import CoupleSerializer, CoupleLeaderboardSerializer, CouplePeriodLeaderboardSerializer, CoupleMessageSerializer, CoupleMessageSearchSerializer
+from .couple import get_user_couple, get_user_couple_id, get_pairing_status, invalidate_user_couple
+from .attempts import pairing_attempts_blocked, record_pairing_attempt
+from .leaderboard import PERIODS, period_ranking, period_start, ranking
+from .messages import HISTORY_PAGE_SIZE, mark_read, message_page, read_marks
+from .pairing_codes import PairingCodesExhausted
+from .search import SEARCH_PAGE_SIZE, search_messages
 
 from rest_framework.permissions import IsAuthenticated
 from rest_framework import status
@@ -13,7 +19,6 @@ from rest_framework.throttling import UserRateThrottle, AnonRateThrottle
 from rest_framework.decorators import throttle_classes
 from rest_framework import generics, permissions
 from rest_framework.response import Response
-from datetime import timedelta
 from core.pusher import pusher_client
 
 
@@ -46,10 +51,7 @@ def initiate_pairing(request):
             logger.info(f"Initiate pairing requested by {user.id}")
             
             # Check existing couples
-            if Couple.objects.filter(
-                models.Q(user1=user) | models.Q(user2=user),
-                is_active=True
-            ).exists():
+            if get_user_couple_id(user):
                 logger.warning(f"User {user.id} already in couple")
                 return Response(...)
             
@@ -67,6 +69,7 @@ def initiate_pairing(request):
 
             code = couple.generate_pairing_code()
             logger.info(f"Generated code {code} for {user.id}")
+            invalidate_user_couple(user)
 
             
             logger.info(f"Couple {couple.id} created successfully")
@@ -77,6 +80,12 @@ def initiate_pairing(request):
                 "message": "Share this code with your partner"
             })
             
+    except PairingCodesExhausted as e:
+        logger.error(f"Pairing initiation failed for {user.id}: {e}")
+        return Response(
+            {"error": "No pairing code available right now, please try again shortly"},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE
+        )
     except Exception as e:
         logger.error(f"Pairing initiation failed: {str(e)}", exc_info=True)
         return Response(
@@ -95,27 +104,16 @@ def confirm_pairing(request):
     pairing_code = request.data.get('pairing_code')
     ip = request.META.get('REMOTE_ADDR')
 
-    # Track attempts
-    attempt = PairingAttempt.objects.create(
-        user=user,
-        ip_address=ip,
-        code_attempt=pairing_code or ''
-    )
-
     if not pairing_code:
+        record_pairing_attempt(user, ip, pairing_code)
         return Response(
             {"error": "Pairing code is required"},
             status=status.HTTP_400_BAD_REQUEST
         )
     
-    # Check for too many recent attempts
-    recent_failures = PairingAttempt.objects.filter(
-        ip_address=ip,
-        was_successful=False,
-        attempted_at__gte=timezone.now() - timedelta(hours=1)
-    ).count()
-
-    if recent_failures >= 5:
+    # Check for too many recent attempts (cache only, no DB reads)
+    if pairing_attempts_blocked(user, ip):
+        record_pairing_attempt(user, ip, pairing_code)
         return Response(
             {"error": "Too many pairing attempts. Please try again later."},
             status=status.HTTP_429_TOO_MANY_REQUESTS
@@ -133,23 +131,22 @@ def confirm_pairing(request):
             raise Couple.DoesNotExist
         
     except Couple.DoesNotExist:
-        attempt.save()
+        record_pairing_attempt(user, ip, pairing_code)
         return Response(
             {'error': "Invalid or expired pairing code"}
         )
     
     # Prevent self-pairing
     if couple.user1 == user:
+        record_pairing_attempt(user, ip, pairing_code)
         return Response(
             {'error': "Cannot pair with yourself"},
             status=status.HTTP_400_BAD_REQUEST
         )
     
     # Check if user is already paired
-    if Couple.objects.filter(
-        models.Q(user1=user) | models.Q(user2=user),
-        is_active=True
-    ).exists():
+    if get_user_couple_id(user):
+        record_pairing_attempt(user, ip, pairing_code)
         return Response(
             {"error": "You're already in a couple"},
             status=status.HTTP_400_BAD_REQUEST
@@ -160,8 +157,7 @@ def confirm_pairing(request):
         couple.pairing_code = None
         couple.pairing_code_expires = None
         couple.save()
-        attempt.was_successful = True
-        attempt.save()
+        record_pairing_attempt(user, ip, pairing_code, successful=True)
 
         pusher_client.trigger(
             f'couple-{couple.id}',
@@ -209,86 +205,241 @@ def check_pairing_status(request):
     - partner_username: string if paired
     - pending_invite: boolean if has pending invite
     - code_expires_at: datetime if pending
+
+    Responses carry an ETag; polling clients sending If-None-Match get a 304
+    while nothing has changed.
     """
 
-    user = request.user
+    response_data, etag = get_pairing_status(request.user)
+
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = Response(response_data)
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+def _query_int(request, name, default, minimum=0, maximum=None):
+    try:
+        value = int(request.query_params.get(name, default))
+    except (TypeError, ValueError):
+        value = default
+    value = max(minimum, value)
+    return min(value, maximum) if maximum is not None else value
+
 
-    # Check active couple
-    active_couple = Couple.objects.filter(
-        (Q(user1=user) | Q(user2=user)),
-        is_active=True
-    ).first()
-
-    # Check pending invite (where user is user2)
-    pending_invite = Couple.objects.filter(
-        user2=user,
-        is_active=False,
-        pairing_code_expires__gt=timezone.now()
-    ).first()
-
-    # Check pending code (where user initiated)
-    pending_code = Couple.objects.filter(
-        user1=user,
-        is_active=False,
-        pairing_code_expires__gt=timezone.now()
-    ).first()
+def _leaderboard_entries(ranks):
+    """Serialize couples in rank order; `ranks` maps couple id -> rank"""
+    couples = Couple.objects.select_related('user1', 'user2').in_bulk(list(ranks))
+    ordered = [couples[couple_id] for couple_id in ranks if couple_id in couples]
+    return CoupleLeaderboardSerializer(ordered, many=True, context={'ranks': ranks}).data
 
+
+@api_view(['GET'])
+def leaderboard(request):
+    """
+    Couples ranked by combined points
+    Query params:
+    - offset: rank offset to start from (default 0)
+    - limit: page size (default 20, max LEADERBOARD_MAX_LIMIT)
+    - couple_id: also return this couple's rank and entry
+    """
+    offset = _query_int(request, 'offset', 0)
+    limit = _query_int(request, 'limit', 20, minimum=1, maximum=settings.LEADERBOARD_MAX_LIMIT)
+
+    page = ranking.page(offset, limit)
     response_data = {
-        'is_paired': active_couple is not None,
-        'couple_id': str(active_couple.id) if active_couple else None,
-        'partner_username': (
-            active_couple.user1.username if active_couple and active_couple.user2 == user
-            else active_couple.user2.username if active_couple
-            else None
-        ),
-        'pending_invite': pending_invite is not None,
-        'pending_code': pending_code is not None,
-        'code_expires_at': (
-            pending_code.pairing_code_expires.isoformat() 
-            if pending_code 
-            else None
-        )
+        'count': ranking.count(),
+        'offset': offset,
+        'limit': limit,
+        'results': _leaderboard_entries({couple_id: rank for rank, couple_id, _ in page}),
     }
-    
+
+    couple_id = _query_int(request, 'couple_id', 0)
+    if couple_id:
+        rank = ranking.rank(couple_id)
+        entries = _leaderboard_entries({couple_id: rank}) if rank else []
+        response_data['couple'] = entries[0] if entries else None
+
     return Response(response_data)
 
+
 @api_view(['GET'])
-def leaderboard(request):
-    couples = Couple.objects.filter(is_active=True).order_by('-combined_points')[:20]
-    serializer = CoupleLeaderboardSerializer(couples, many=True)
-    return Response(serializer.data)
+def period_leaderboard(request, period):
+    """
+    Couples ranked by points earned this week (Monday onwards) or this month
+    Query params:
+    - offset, limit: as for the lifetime leaderboard
+    """
+    if period not in PERIODS:
+        return Response(
+            {'error': f"Unknown period, expected one of: {', '.join(PERIODS)}"},
+            status=status.HTTP_404_NOT_FOUND
+        )
+
+    offset = _query_int(request, 'offset', 0)
+    limit = _query_int(request, 'limit', 20, minimum=1, maximum=settings.LEADERBOARD_MAX_LIMIT)
+    page = period_ranking(period, offset, limit)
+
+    ranks = {couple_id: rank for rank, couple_id, _ in page}
+    couples = Couple.objects.select_related('user1', 'user2').in_bulk(list(ranks))
+    serializer = CouplePeriodLeaderboardSerializer(
+        [couples[couple_id] for couple_id in ranks if couple_id in couples],
+        many=True,
+        context={'ranks': ranks, 'points': {couple_id: points for _, couple_id, points in page}}
+    )
+    return Response({
+        'period': period,
+        'start': period_start(period).isoformat(),
+        'offset': offset,
+        'limit': limit,
+        'results': serializer.data,
+    })
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
-def get_message_history(request):
+def leaderboard_around_me(request):
+    """
+    The requesting couple plus up to `k` couples ranked directly above and below it
+    Query params:
+    - k: neighbours on each side (default 5, max 50)
+    """
     couple = get_user_couple(request.user)
     if not couple:
+        return Response(
+            {'error': 'You need to be in an active couple to see your ranking'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+
+    k = _query_int(request, 'k', 5, maximum=50)
+    points = couple.combined_points
+    active = Couple.objects.filter(is_active=True).select_related('user1', 'user2')
+
+    # Keyset scans outward from our (combined_points, id) position; the plain
+    # range bound lets the planner use the points index for the OR
+    above = list(active.filter(
+        Q(combined_points__gt=points) | Q(combined_points=points, id__lt=couple.id),
+        combined_points__gte=points
+    ).order_by('combined_points', '-id')[:k])[::-1]
+    below = list(active.filter(
+        Q(combined_points__lt=points) | Q(combined_points=points, id__gt=couple.id),
+        combined_points__lte=points
+    ).order_by('-combined_points', 'id')[:k])
+
+    rank = ranking.rank(couple.id)
+    ordered = above + [couple] + below
+    ranks = {}
+    if rank:
+        first = rank - len(above)
+        ranks = {c.id: first + i for i, c in enumerate(ordered)}
+
+    return Response({
+        'rank': rank,
+        'count': ranking.count(),
+        'results': CoupleLeaderboardSerializer(ordered, many=True, context={'ranks': ranks}).data,
+    })
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_message_history(request):
+    """
+    Couple chat history, newest first
+    Query params:
+    - before: cursor of a message; return messages older than it
+    - after: cursor of a message; return messages newer than it
+    - limit: page size (default 50, max 100)
+    Every message carries its own `cursor`.
+    """
+    couple_id = get_user_couple_id(request.user)
+    if not couple_id:
         return Response(
             {'error': 'You need to be in an active couple to view messages'},
             status=status.HTTP_403_FORBIDDEN
         )
     
-    messages = CoupleMessage.objects.filter(couple=couple).order_by('-timestamp')[:50]
-    serializer = CoupleMessageSerializer(messages, many=True)
+    limit = _query_int(request, 'limit', HISTORY_PAGE_SIZE, minimum=1, maximum=100)
+    try:
+        messages = message_page(
+            couple_id,
+            before=request.query_params.get('before'),
+            after=request.query_params.get('after'),
+            limit=limit
+        )
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    serializer = CoupleMessageSerializer(messages, many=True, context={'read_marks': read_marks(couple_id)})
     return Response(serializer.data)
 
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def search_message_history(request):
+    """
+    Full-text search over the couple's chat, best match first
+    Query params:
+    - q: search terms (all must match)
+    - cursor: `next_cursor` from the previous page
+    - limit: page size (default 20, max 50)
+    """
+    couple_id = get_user_couple_id(request.user)
+    if not couple_id:
+        return Response(
+            {'error': 'You need to be in an active couple to search messages'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+
+    query = request.query_params.get('q', '').strip()
+    if not query:
+        return Response({'error': 'Search query is required'}, status=status.HTTP_400_BAD_REQUEST)
+
+    limit = _query_int(request, 'limit', SEARCH_PAGE_SIZE, minimum=1, maximum=50)
+    try:
+        results, next_cursor = search_messages(
+            couple_id, query, cursor=request.query_params.get('cursor'), limit=limit
+        )
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    messages = [message for _, message in results]
+    context = {
+        'scores': {message.id: score for score, message in results},
+        'read_marks': read_marks(couple_id),
+    }
+    return Response({
+        'results': CoupleMessageSearchSerializer(messages, many=True, context=context).data,
+        'next_cursor': next_cursor,
+    })
+
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def mark_messages_as_read(request):
-    couple = get_user_couple(request.user)
-    if not couple:
+    couple_id = get_user_couple_id(request.user)
+    if not couple_id:
         return Response(
             {'error': 'You need to be in an active couple to mark messages'},
             status=status.HTTP_403_FORBIDDEN
         )
     
-    # Mark all unread messages from partner as read
-    partner = couple.user1 if request.user == couple.user2 else couple.user2
-    CoupleMessage.objects.filter(
-        sender=partner,
-        is_read=False
-    ).update(is_read=True)
+    # Everything up to now counts as read; no message rows are touched
+    mark_read(couple_id, request.user.id)
     
-    return Response({'status': 'success'})
\ No newline at end of file
+    return Response({'status': 'success'})
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def unread_message_count(request):
+    couple_id = get_user_couple_id(request.user)
+    if not couple_id:
+        return Response(
+            {'error': 'You need to be in an active couple to view messages'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+
+    state = CoupleReadState.objects.filter(couple_id=couple_id, user=request.user).first()
+    return Response({
+        'unread': state.unread_count if state else 0,
+        'last_read_at': state.last_read_at if state else None,
+    })
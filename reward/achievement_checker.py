@@ -1,4 +1,5 @@
 from django.db import transaction
+from couple.points import award_xp
 from .models import Achievement, CoupleAchievement
 
 class AchievementChecker:
@@ -34,7 +35,4 @@ class AchievementChecker:
             achievement=achievement
         )
         # Award XP to both users
-        couple.user1.userprofile.xp += achievement.xp_reward
-        couple.user2.userprofile.xp += achievement.xp_reward
-        couple.user1.userprofile.save()
-        couple.user2.userprofile.save()
\ No newline at end of file
+        award_xp([couple.user1_id, couple.user2_id], achievement.xp_reward, couple_id=couple.id)
\ No newline at end of file
@@ -10,7 +10,8 @@ from rest_framework.decorators import permission_classes
 from django.db import transaction
 from django.db import models
 from .achievement_checker import AchievementChecker
-from couple.couple import get_user_couple
+from couple.couple import get_user_couple, get_user_couple_id
+from couple.points import award_xp, spend_xp
 
 class RewardListView(generics.ListAPIView):
     """
@@ -20,14 +21,12 @@ class RewardListView(generics.ListAPIView):
     serializer_class = AchievementSerializer
 
 @api_view(['POST'])
+@transaction.atomic
 def redeem_reward(request, reward_id):
     reward = Reward.objects.get(id=reward_id)
-    profile = request.user.userprofile
-    if profile.xp >= reward.cost:
-        profile.xp -= reward.cost
-        profile.save()
-        reward.is_unlocked = True
-        reward.save()
+    # The balance check happens inside the UPDATE, so concurrent redeems can't overspend
+    if spend_xp(request.user.id, reward.cost, couple_id=get_user_couple_id(request.user)):
+        Reward.objects.filter(id=reward.id).update(is_unlocked=True)
         return Response({'success': f'Reward "{reward.name}" unlocked!'})
     return Response({'error': 'Not enough XP!'}, status=400)
 
@@ -78,10 +77,7 @@ def reward_achievement(request):
         )
 
         # Update couple XP (sum for both users)
-        couple.user1.profile.xp += achievement.xp_reward
-        couple.user2.profile.xp += achievement.xp_reward
-        couple.user1.profile.save()
-        couple.user2.profile.save()
+        award_xp([couple.user1_id, couple.user2_id], achievement.xp_reward, couple_id=couple.id)
 
         return Response({
             'success': True,
@@ -108,10 +104,10 @@ def reward_achievement(request):
 
 @api_view(['GET'])
 def get_achievements(request):
-    couple = get_user_couple(request.user)  # Assuming user is in a couple
+    couple_id = get_user_couple_id(request.user)  # Assuming user is in a couple
     
     unlocked = CoupleAchievement.objects.filter(
-        couple=couple
+        couple_id=couple_id
     ).select_related('achievement')
     
     locked = Achievement.objects.exclude(
@@ -27,7 +27,7 @@ def update_user_stats(user, xp_earned):
     profile.level = calculate_level(profile.xp)
     
     # Update streak
-    today = timezone.now().date()
+    today = timezone.localdate()
     if profile.last_active == today - timedelta(days=1):
         profile.streak += 1
     elif profile.last_active != today:
@@ -6,8 +6,6 @@ from rest_framework.response import Response
 from rest_framework import status
 from .signals import update_user_stats
 from django.db import transaction
-from couple.models import Couple
-from django.db.models import Q
 from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync
 from reward import achievement_checker
@@ -16,7 +14,8 @@ from rest_framework.pagination import PageNumberPagination
 from rest_framework import filters
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import serializers
-from couple.couple import get_user_couple
+from couple.couple import get_user_couple_id
+from couple.points import award_xp
 from core.pusher import pusher_client
 
 
@@ -72,7 +71,7 @@ def complete_task(request, task_id):
         user = request.user
 
         # Verify authorization
-        if user not in [task.couple.user1, task.couple.user2]:
+        if user.id not in (task.couple.user1_id, task.couple.user2_id):
             return Response(
                 {'error': 'Unauthorized to complete this task'},
                 status=status.HTTP_403_FORBIDDEN
@@ -117,23 +116,8 @@ def complete_task(request, task_id):
         streak_bonus = task.couple.get_streak_bonus()
         bonus_points = int(task.points * streak_bonus)
 
-        # Update user stats
-        user_profile = user.userprofile
-        user_profile.xp += task.points
-        user_profile.level = calculate_level(user_profile.xp)
-        user_profile.save()
-
-        # Update couple points if paired
-        couple = Couple.objects.filter(
-            (Q(user1=user) | Q(user2=user)) & Q(is_active=True)
-        ).first()
-
-        if couple:
-            couple.combined_points = (
-                couple.user1.userprofile.xp + 
-                (couple.user2.userprofile.xp if couple.user2 else 0)
-            )
-            couple.save()
+        # Update user stats and couple points if paired
+        award_xp([user.id], task.points, couple_id=get_user_couple_id(user))
 
         return Response(TaskSerializer(task).data)
 
@@ -156,24 +140,21 @@ def create_task(request):
     serializer = TaskCreateSerializer(data=request.data)
     if serializer.is_valid():
         # Get user's active couple
-        couple = Couple.objects.filter(
-            (Q(user1=request.user) | Q(user2=request.user)) & 
-            Q(is_active=True)
-        ).first()
+        couple_id = get_user_couple_id(request.user)
         
-        if not couple:
+        if not couple_id:
             return Response(
                 {'error': 'You need to be in an active couple to create tasks'},
                 status=status.HTTP_403_FORBIDDEN
             )
         
         task = serializer.save(
-            couple=couple,
+            couple_id=couple_id,
             created_by=request.user
         )
 
         pusher_client.trigger(
-            f"couple-{couple.id}",
+            f"couple-{couple_id}",
             "task_created",
             {
                 "task": TaskSerializer(task).data,
@@ -192,11 +173,11 @@ def get_tasks(request):
     status = request.query_params.get('status', None)
     page = request.query_params.get('page', 1)
     
-    couple = get_user_couple(request.user)
-    if not couple:
+    couple_id = get_user_couple_id(request.user)
+    if not couple_id:
         return Response({'error': 'No active couple'}, status=400)
     
-    tasks = Task.objects.filter(couple=couple)
+    tasks = Task.objects.filter(couple_id=couple_id)
     
     # Filter by status
     if status == 'done':
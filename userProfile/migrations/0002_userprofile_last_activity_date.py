@@ -0,0 +1,26 @@
+# Generated by Django 5.2.3 on 2026-10-18 08:44
+
+from django.db import migrations, models
+from django.db.models.functions import TruncDate
+
+
+def backfill_activity_dates(apps, schema_editor):
+    """Best guess for running streaks: the day of the last save"""
+    UserProfile = apps.get_model('userProfile', 'UserProfile')
+    UserProfile.objects.filter(streak__gt=0).update(last_activity_date=TruncDate('last_active'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('userProfile', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='last_activity_date',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_activity_dates, migrations.RunPython.noop),
+    ]
@@ -47,6 +47,8 @@ class UserProfile(models.Model):
     level = models.IntegerField(default=1)
     streak = models.IntegerField(default=0)
     last_active = models.DateTimeField(auto_now=True)
+    # Day the streak last counted; last_active moves on every save
+    last_activity_date = models.DateField(null=True, blank=True)
 
     def calculate_level(self):
         # example: Level = sqrt(xp / 100)
@@ -54,14 +56,19 @@ class UserProfile(models.Model):
         self.save()
 
     def update_streak(self):
-        today = timezone.now().date()
-        if self.last_active == today - timedelta(days=1):
-            self.streak == 1
-        elif self.last_active != today:
+        """Count today's activity; repeat activity on the same day doesn't write"""
+        today = timezone.localdate()
+        last_day = self.last_activity_date
+        if last_day == today and self.streak:
+            return self.streak
+
+        if last_day == today - timedelta(days=1):
             self.streak += 1
-        
-        self.last_active = today
-        self.save()
+        else:
+            self.streak = 1
+        self.last_activity_date = today
+        self.save(update_fields=['streak', 'last_activity_date', 'last_active'])
+        return self.streak
 
     def __str__(self):
         return f"{self.user.username}'s Profile"
\ No newline at end of file